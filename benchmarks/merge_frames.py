@@ -0,0 +1,51 @@
+"""Benchmark merging extractor frames, concat + groupby("first") versus BaseTransform.merge_frames
+
+Run with: python benchmarks/merge_frames.py [number of days]
+"""
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from metrics_collector.transform.base import BaseTransform
+
+
+def make_extractor_frames(number_extractors: int, days=3650, columns=8, seed=0) -> list[pd.DataFrame]:
+    """Frames shaped like BaseExtract.to_df(), disjoint columns except one shared by all"""
+    rng = np.random.default_rng(seed)
+    all_dates = pd.date_range("2012-01-01", periods=days, freq="D").date
+    frames = []
+    for i in range(number_extractors):
+        dates = np.sort(rng.choice(all_dates, size=int(days * 0.8), replace=False))
+        data = {f"metric_{i}_{c}": rng.random(len(dates)) for c in range(columns)}
+        data["shared_steps_count"] = np.where(rng.random(len(dates)) > 0.5, rng.random(len(dates)), np.nan)
+        df = pd.DataFrame(data, index=pd.Index(dates, name="date"))
+        df.insert(0, "date", dates)
+        frames.append(df)
+    return frames
+
+
+def concat_and_groupby(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """The previous path of BaseTransform.__init__ + index_as_dt + aggregate_combined_dataframes"""
+    df = pd.concat(frames)
+    df.index = pd.to_datetime(df.index)
+    df.sort_index(kind="mergesort", inplace=True)  # stable, so "first" follows the extractor order
+    df = df.groupby(df.index).agg({_: "first" for _ in df.columns})
+    return df.drop("date", axis=1)
+
+
+def main(days=3650, repeat=5):
+    print(f"{'extractors':>10} {'concat+groupby ms':>18} {'merge_frames ms':>16} {'speedup':>8}")
+    for n in range(2, 11):
+        frames = make_extractor_frames(n, days)
+        expected = concat_and_groupby(frames)
+        result = BaseTransform.merge_frames(frames)
+        pd.testing.assert_frame_equal(expected, result, check_names=False, check_freq=False)
+        old = min(timeit.repeat(lambda: concat_and_groupby(frames), number=1, repeat=repeat)) * 1000
+        new = min(timeit.repeat(lambda: BaseTransform.merge_frames(frames), number=1, repeat=repeat)) * 1000
+        print(f"{n:>10} {old:>18.1f} {new:>16.1f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(_) for _ in sys.argv[1:2]))
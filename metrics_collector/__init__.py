@@ -1 +0,0 @@
-from metrics_collector import extract, transform, load
@@ -5,9 +5,6 @@ from enum import Enum
 from pathlib import Path
 import appdirs
 import typer
-from metrics_collector.scheduler import MyScheduler
-from metrics_collector.scheduler.tasks import default_initial_scheduled_tasks
-from metrics_collector.web.service import WebServer
 from loguru import logger
 import logging
 
@@ -51,6 +48,9 @@ def start_logging(data_dir, log_level):
 
 
 def start_initial_loop(port):
+    from metrics_collector.scheduler import MyScheduler  # imported as started, keeping the cli responsive
+    from metrics_collector.scheduler.tasks import default_initial_scheduled_tasks
+    from metrics_collector.web.service import WebServer
     scheduler = MyScheduler(initials=default_initial_scheduled_tasks)
     WebServer((scheduler,), port=port)  # send services to be started with uvicorn
 
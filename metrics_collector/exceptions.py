@@ -6,3 +6,8 @@ class MetricsBaseException(Exception):
 class MetricsExtractException(MetricsBaseException):
     """Occurs if e.g. fs fails connect to ftp"""
     ...
+
+
+class MetricsRenderException(MetricsBaseException):
+    """Occurs if e.g. rendering a graph image times out"""
+    ...
@@ -13,8 +13,8 @@ import json
 from appdirs import user_data_dir
 from deepmerge import always_merger
 from statistics import mean
-from metrics_collector.orchestrator.generic import register_dag_name
-from metrics_collector.utils import get_data_dir
+from metrics_collector.orchestrator.generic import register_dag_name, ClassType
+from metrics_collector.utils import get_data_dir, write_atomic
 
 Number = Union[int, float]
 
@@ -59,7 +59,7 @@ class BaseExtract(ABC):
             raise NotImplemented(
                 "the dag_name is required for extract, transform and load subclasses"
             )
-        register_dag_name(cls)
+        register_dag_name(cls, ClassType.extract)
 
     def _get_arguments(self):
         try:
@@ -84,6 +84,19 @@ class BaseExtract(ABC):
         Path(self.data_dir).mkdir(exist_ok=True)
         return f"{self.data_dir}/{self.__class__.__name__}.json"
 
+    def get_missing_days(self, dates: Iterable[str]) -> list[str]:
+        """Get days not yet extracted and cached"""
+        cached = self.from_json(self.get_cache_file()) or {}
+        return [_ for _ in dates if _ not in cached]
+
+    def get_data_version(self) -> str | None:
+        """Cheap fingerprint of cached data, changes whenever new data been extracted"""
+        f = Path(self.get_cache_file())
+        if not f.exists():
+            return None
+        stat = f.stat()
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
     @classmethod
     def store_params(cls, params: dict):
         Path(cls.data_dir).mkdir(exist_ok=True)
@@ -127,8 +140,7 @@ class BaseExtract(ABC):
             else:
                 self.pop_existing_days(current_data, data)
                 data = always_merger.merge(current_data, data)
-        with open(filename, "w") as f:
-            json.dump(data, f, indent=2)
+        write_atomic(f, json.dumps(data, indent=2))  # readers e.g. a preview never see it partially written
 
     @staticmethod
     def from_json(filename: Optional[str], date_=None) -> Union[DaysMetrics, None]:
@@ -1,3 +1 @@
 from .base import BaseTransform, GraphFormat
-from metrics_collector.utils import load_all_submodules
-load_all_submodules(__name__)
\ No newline at end of file
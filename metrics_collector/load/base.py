@@ -1,10 +1,13 @@
 import collections
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABC, abstractmethod
 from enum import auto
 from typing import Callable, Iterable, Annotated
 
-from metrics_collector.orchestrator.generic import register_dag_name
+from metrics_collector.load.downsample import downsample_figure
+from metrics_collector.load.rollup import Rollup
+from metrics_collector.orchestrator.generic import register_dag_name, ClassType
 from metrics_collector.transform.base import BaseTransform
 from fastapi_utils.enums import StrEnum
 
@@ -14,26 +17,48 @@ class GraphFormat(StrEnum):
 
     html = auto()
     png = auto()
+    json = auto()
+
+
+def uses_columns(*columns: str):
+    """Declare the columns of the pipeline result a graph method use, allows skipping other derived columns"""
+
+    def decorator(func):
+        func.columns = frozenset(columns)
+        return func
+
+    return decorator
 
 
 class BaseLoadGraph(ABC):
-    graph_formats = {GraphFormat.png: "to_png", GraphFormat.html: "to_html"}
+    graph_formats = {
+        GraphFormat.png: "to_png",
+        GraphFormat.html: "to_html",
+        GraphFormat.json: "to_json",
+    }
+    max_points: int | None = 400  # per trace before downsampling (about 2 px each of 500-900 px wide graphs), None to disable
 
     dag_name: str | Iterable = NotImplemented
 
     def __init__(
-        self, transformer: BaseTransform, from_: datetime.date, to_: datetime.date
+        self,
+        transformer: BaseTransform,
+        from_: datetime.date,
+        to_: datetime.date,
+        graph_names: Iterable[str] | None = None,
     ):
+        """Process the pipeline for all graphs or only what columns graph_names require"""
         self.transformer = transformer
-        self.transformer.validate()
-        self.df = self.transformer.process_pipeline(from_, to_)
+        columns = self.get_required_columns(graph_names) if graph_names else None
+        self.df = self.transformer.run_pipeline(from_, to_, columns)
+        self.rollup = Rollup(self.df)  # shared resampling for all graph methods
 
     def __init_subclass__(cls, **kwargs):
         if cls.dag_name is NotImplemented:
             raise NotImplemented(
                 "the dag_name is required for extract, transform and load subclasses"
             )
-        register_dag_name(cls)
+        register_dag_name(cls, ClassType.load)
 
     @abstractmethod
     def to_html(self, graph_method: Callable) -> str:
@@ -43,13 +68,39 @@ class BaseLoadGraph(ABC):
     def to_png(self, graph_method: Callable) -> bytes:
         """Convert result of graph method into png bytes"""
 
+    def to_json(self, graph_method: Callable) -> str:
+        """Convert result of graph method into plotly figure JSON rendered by the client"""
+        return self.get_figure(graph_method).to_json()
+
     @abstractmethod
     def get_all_graph_methods(
         self,
     ) -> Iterable[Annotated[Callable, "Class methods generating graphs"]]:
         """Return list with methods generating graphs"""
 
+    def get_figure(self, graph_method: Callable):
+        """Get result of graph method with long series downsampled to max_points"""
+        figure = graph_method()
+        if self.max_points:
+            figure = downsample_figure(figure, self.max_points)
+        return figure
+
+    def get_required_columns(
+        self, graph_names: Iterable[str]
+    ) -> frozenset[str] | None:
+        """Columns used by graph methods, None if any of those has not declared @uses_columns"""
+        columns = set()
+        for graph_method in self.get_all_graph_methods():
+            if graph_method.__name__ not in graph_names:
+                continue
+            if (graph_columns := getattr(graph_method, "columns", None)) is None:
+                return None
+            columns |= graph_columns
+        return frozenset(columns)
+
     def get_all_graphs(self, graph_format: GraphFormat):
+        """Generate all graphs concurrently, yielded in the order of get_all_graph_methods()"""
         format_method = getattr(self, self.graph_formats[graph_format])
-        for graph_method in self.get_all_graph_methods():
-            yield format_method(graph_method)
+        graph_methods = list(self.get_all_graph_methods())
+        with ThreadPoolExecutor(max_workers=len(graph_methods) or 1) as executor:
+            yield from executor.map(format_method, graph_methods)
@@ -0,0 +1,88 @@
+import math
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+point_attributes = ("x", "y", "text", "hovertext", "customdata")
+
+
+def _as_numeric(values) -> np.ndarray:
+    """Numeric representation of x values, datetimes as nanoseconds"""
+    values = np.asarray(values)
+    if values.dtype.kind == "M":
+        return values.astype("datetime64[ns]").astype(np.int64).astype(float)
+    if values.dtype.kind == "O":
+        try:
+            return pd.to_datetime(values).asi8.astype(float)
+        except (TypeError, ValueError):
+            pass
+    try:
+        return values.astype(float)
+    except (TypeError, ValueError):
+        return np.arange(len(values), dtype=float)
+
+
+def lttb_indices(x, y, threshold: int) -> np.ndarray:
+    """Largest-triangle-three-buckets, indices of the points keeping the visual shape of a line"""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x, y = _as_numeric(x), np.asarray(y, dtype=float)
+    bucket_size = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = math.floor(i * bucket_size) + 1
+        end = math.floor((i + 1) * bucket_size) + 1
+        next_end = min(math.floor((i + 2) * bucket_size) + 1, n)
+        avg_x = np.nanmean(x[end:next_end])
+        avg_y = np.nanmean(y[end:next_end]) if not np.isnan(y[end:next_end]).all() else y[a]
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(np.nan_to_num(area, nan=-1)))
+        indices[i + 1] = a
+    return indices
+
+
+def minmax_indices(y, threshold: int) -> np.ndarray:
+    """Min/max bucketing, indices of the lowest and highest value within each bucket e.g. for bars"""
+    n = len(y)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+    y = np.nan_to_num(np.asarray(y, dtype=float), nan=0)
+    indices = set()
+    for bucket in np.array_split(np.arange(n), threshold // 2):
+        values = y[bucket]
+        indices.update((bucket[np.argmin(values)], bucket[np.argmax(values)]))
+    return np.array(sorted(indices))
+
+
+def downsample_figure(figure, target: int):
+    """Reduce traces of a plotly figure having more points than target, lines using LTTB and bars min/max.
+    Bars of equal length share the same points (by their total) to keep them stacked/grouped."""
+    bar_totals = {}
+    for trace in figure.data:
+        if trace.type == "bar" and trace.y is not None and len(trace.y) > target:
+            y = np.nan_to_num(np.asarray(trace.y, dtype=float), nan=0)
+            bar_totals[len(y)] = bar_totals.get(len(y), 0) + y
+    bar_indices = {n: minmax_indices(total, target) for n, total in bar_totals.items()}
+    for trace in figure.data:
+        y = getattr(trace, "y", None)
+        if y is None or len(y) <= target:
+            continue
+        x = trace.x if trace.x is not None else np.arange(len(y))
+        if trace.type == "bar":
+            indices = bar_indices[len(y)]
+        elif trace.type in ("scatter", "scattergl"):
+            indices = lttb_indices(x, y, target)
+        else:
+            continue
+        logger.debug(f"downsampling {trace.type} {trace.name} from {len(y)} to {len(indices)} points")
+        for attribute in point_attributes:
+            values = getattr(trace, attribute, None)
+            if values is not None and not isinstance(values, str) and len(values) == len(y):
+                setattr(trace, attribute, np.asarray(values)[indices])
+    return figure
@@ -4,7 +4,8 @@ import plotly.graph_objects as go
 import plotly.express as px
 from typing import Callable, Annotated, Iterable
 
-from metrics_collector.load.base import BaseLoadGraph
+from metrics_collector.load.base import BaseLoadGraph, uses_columns
+from metrics_collector.load.render import RendererPool
 
 
 class GarminAppleLoadGraph(BaseLoadGraph):
@@ -21,16 +22,18 @@ class GarminAppleLoadGraph(BaseLoadGraph):
         )
 
     def to_html(self, graph_method: Callable) -> str:
-        return graph_method().to_html(include_plotlyjs="require", full_html=False)
+        return self.get_figure(graph_method).to_html(
+            include_plotlyjs="require", full_html=False
+        )
 
     def to_png(self, graph_method: Callable) -> bytes:
-        return graph_method().to_image(format="png")
+        return RendererPool.get_instance().render(self.get_figure(graph_method), "png")
 
+    @uses_columns("avg_speed_running_trip", "running_distance_meters")
     def graph_monthly_run_count_pace(self) -> plotly.graph_objects.Figure:
-        df = self.df.copy()
         # Require preparing data
-        df = df.resample("M").agg(
-            {"avg_speed_running_trip": "max", "running_distance_meters": "count"}
+        df = self.rollup.get(
+            "M", {"avg_speed_running_trip": "max", "running_distance_meters": "count"}
         )
         df.rename(columns={"running_distance_meters": "number_of_runs"}, inplace=True)
         df.astype(float)
@@ -73,8 +76,9 @@ class GarminAppleLoadGraph(BaseLoadGraph):
         )
         return fig
 
+    @uses_columns("walking_km", "running_km", "total_distance_km")
     def graph_weekly_distance(self) -> plotly.graph_objs.Figure:
-        df = self.df.resample("W").sum()
+        df = self.rollup.get("W", "sum")
         df["walking_running_km_mean"] = df.total_distance_km.mean()
         fig = px.bar(
             df, y=["walking_km", "running_km"], title="Weekly distance", height=500
@@ -87,8 +91,9 @@ class GarminAppleLoadGraph(BaseLoadGraph):
         fig.add_traces(line.data)
         return fig
 
+    @uses_columns("bloodpressuresystolic_mmHg", "bloodpressurediastolic_mmHg")
     def graph_weekly_blood_pressure(self) -> plotly.graph_objs.Figure:
-        df = self.df.resample("W").max()
+        df = self.rollup.get("W", "max")
         both = ["bloodpressuresystolic_mmHg", "bloodpressurediastolic_mmHg"]
         for _ in both:
             df[_] = df[_].rolling(3).mean()
@@ -99,8 +104,9 @@ class GarminAppleLoadGraph(BaseLoadGraph):
         )
         return fig
 
+    @uses_columns("bodymass_kg")
     def graph_weekly_weight(self) -> plotly.graph_objs.Figure:
-        df = self.df.resample("W").max()
+        df = self.rollup.get("W", "max")
         df["bodymass_kg"] = df["bodymass_kg"].rolling(5).mean()
         fig = px.line(df, y="bodymass_kg", title="Weekly average weight", height=500)
         fig.update_layout(
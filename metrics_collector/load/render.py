@@ -0,0 +1,174 @@
+import os
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Iterable, Annotated, Any, Literal
+
+from loguru import logger
+
+from metrics_collector.exceptions import MetricsRenderException
+
+
+class RendererPool:
+    """Pool of warm kaleido processes rendering plotly figures into images in parallel.
+    Each process takes seconds to start, so they are shared by get_instance().
+
+    Example:
+        pool = RendererPool.get_instance()
+        png_bytes = pool.render(figure)
+        all_png_bytes = pool.render_many(figures)
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+    mathjax = False  # graphs use no LaTeX, skipping it speed up start of each process
+
+    def __init__(
+        self,
+        workers: Annotated[int | None, "defaults to env RENDER_WORKERS or up to 4"] = None,
+        max_queue: Annotated[int, "renders allowed to wait for a worker"] = 16,
+        timeout: Annotated[int, "seconds"] = 60,
+    ):
+        self.workers = workers or int(os.getenv("RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="render")
+        self._slots = threading.BoundedSemaphore(self.workers + max_queue)
+        self._scopes: queue.Queue = queue.Queue()
+        self._scopes_created = 0
+        self._scopes_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(workers={self.workers}, warm={self._scopes_created})"
+
+    @classmethod
+    def get_instance(cls) -> "RendererPool":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def _reset_after_fork(cls) -> None:
+        """Forget the instance inherited by a forked child, e.g. of the scheduler "render" executor:
+        its threads don't exist in the child and its kaleido processes belong to the parent"""
+        cls._instance = None
+        cls._instance_lock = threading.Lock()
+
+    def _new_scope(self):
+        try:
+            import plotly.io as pio
+            from kaleido.scopes.plotly import PlotlyScope
+        except ImportError:
+            logger.warning("kaleido not available, rendering using figure.to_image()")
+            return None
+        return PlotlyScope(plotlyjs=pio.kaleido.scope.plotlyjs, mathjax=self.mathjax)
+
+    @staticmethod
+    def _kaleido(scope, action: Literal["start", "stop"]) -> None:
+        """Start or stop the process of scope, the only use of kaleido's private API, tolerating versions lacking it"""
+        method = getattr(scope, {"start": "_ensure_kaleido", "stop": "_shutdown_kaleido"}[action], None)
+        if method is None:
+            return
+        try:
+            method()
+        except Exception as e:
+            if action == "start":
+                raise MetricsRenderException(f"unable to start renderer: {e}")
+            logger.warning(f"unable to stop renderer: {e}")
+
+    def _start_new_scope(self):
+        """Started scope of a slot already counted by the caller, released if failing to start"""
+        try:
+            scope = self._new_scope()
+            self._kaleido(scope, "start")
+            return scope
+        except BaseException:
+            with self._scopes_lock:
+                self._scopes_created -= 1
+            raise
+
+    def _discard_scope(self, scope):
+        """Stop scope e.g. hung, its slot is started anew by the next render"""
+        self._kaleido(scope, "stop")
+        with self._scopes_lock:
+            self._scopes_created -= 1
+
+    def _acquire_scope(self):
+        with self._scopes_lock:
+            start = self._scopes.empty() and self._scopes_created < self.workers
+            if start:
+                self._scopes_created += 1
+                logger.debug(f"starting renderer {self._scopes_created}/{self.workers}")
+        if start:
+            return self._start_new_scope()
+        try:
+            return self._scopes.get(timeout=self.timeout)
+        except queue.Empty:
+            raise MetricsRenderException(f"no renderer available within {self.timeout} secs")
+
+    def _render(self, figure, format_: str, state: dict) -> bytes:
+        scope = state["scope"] = self._acquire_scope()
+        try:
+            if scope is None:
+                return figure.to_image(format=format_)
+            return scope.transform(figure, format=format_)
+        finally:
+            with self._scopes_lock:
+                timed_out = state["timed_out"]
+            if timed_out:
+                self._discard_scope(scope)
+            else:
+                self._scopes.put(scope)  # keep it warm for next render
+
+    def warm_up(self):
+        """Start all kaleido processes in advance"""
+        with self._scopes_lock:
+            missing = self.workers - self._scopes_created
+            self._scopes_created = self.workers
+        logger.debug(f"starting {missing} renderers")
+        for future in [self._executor.submit(self._start_new_scope) for _ in range(missing)]:
+            try:
+                self._scopes.put(future.result())
+            except MetricsRenderException as e:
+                logger.warning(f"{e}, started once rendering instead")
+
+    def _submit(self, figure, format_: str) -> tuple[Future, dict]:
+        if not self._slots.acquire(timeout=self.timeout):
+            raise MetricsRenderException(f"render queue full, waited {self.timeout} secs")
+        state = {"scope": None, "timed_out": False}
+        future = self._executor.submit(self._render, figure, format_, state)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future, state
+
+    def submit(self, figure, format_: str = "png") -> Future:
+        """Queue rendering of figure, raises MetricsRenderException if the queue is full"""
+        return self._submit(figure, format_)[0]
+
+    def render(self, figure, format_: str = "png") -> bytes:
+        """Render figure into bytes of an image such as png"""
+        return self._result(*self._submit(figure, format_))
+
+    def render_many(self, figures: Iterable[Any], format_: str = "png") -> list[bytes]:
+        """Render figures in parallel, returned in the same order"""
+        submitted = [self._submit(_, format_) for _ in figures]
+        return [self._result(*_) for _ in submitted]
+
+    def _result(self, future: Future, state: dict) -> bytes:
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            if not future.cancel():  # rendering, the hung scope is stopped and replaced
+                with self._scopes_lock:
+                    scope = state["scope"]
+                    state["timed_out"] = scope is not None
+                if scope is not None:
+                    self._kaleido(scope, "stop")
+            raise MetricsRenderException(f"rendering took more than {self.timeout} secs")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        while not self._scopes.empty():
+            self._kaleido(self._scopes.get_nowait(), "stop")
+
+
+os.register_at_fork(after_in_child=RendererPool._reset_after_fork)
@@ -0,0 +1,75 @@
+import hashlib
+import threading
+from typing import Annotated
+
+import pandas as pd
+from loguru import logger
+
+from metrics_collector.storage.cache import Cache
+
+Aggregation = str | dict[Annotated[str, "column"], Annotated[str, "function"]]
+
+
+class Rollup:
+    """Resampled views of a pipeline result, each (resolution, aggregation) pair computed once
+
+    Example:
+        rollup = Rollup(df)
+        weekly = rollup.get("W", "sum")  # resamples the first time
+        weekly = rollup.get("W", "sum")  # served from memory (or from disk in a later process)
+    """
+
+    cache_file_name = "rollup_cache"
+
+    def __init__(self, df: pd.DataFrame, persist: bool = True):
+        self.df = df
+        self.persist = persist
+        self.fingerprint = self.get_fingerprint(df)
+        self._cube: dict[tuple, pd.DataFrame] = {}
+        self._lock = threading.Lock()  # graph methods may run concurrently
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.fingerprint[:8]}, {len(self._cube)} rollups)"
+
+    @staticmethod
+    def get_fingerprint(df: pd.DataFrame) -> str:
+        """Content hash of the dataframe used to key persisted rollups"""
+        h = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+        h.update(",".join(str(_) for _ in df.columns).encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def _aggregation_key(aggregation: Aggregation) -> str | tuple:
+        return (
+            aggregation
+            if isinstance(aggregation, str)
+            else tuple(sorted(aggregation.items()))
+        )
+
+    def get(self, resolution: str, aggregation: Aggregation) -> pd.DataFrame:
+        """Get dataframe resampled by resolution (e.g. "W" or "M") and aggregation (e.g. "sum" or per column dict)"""
+        key = (resolution, self._aggregation_key(aggregation))
+        with self._lock:
+            if key not in self._cube:
+                df = self._load(key)
+                if df is None:
+                    logger.debug(f"computing rollup {key} for {self.fingerprint[:8]}")
+                    df = self.df.resample(resolution).agg(aggregation)
+                    self._store(key, df)
+                self._cube[key] = df
+            return self._cube[key].copy()  # graph methods are free to modify their copy
+
+    def _signature(self, key: tuple) -> str:
+        return f"[{self.fingerprint}, {key}]"
+
+    def _load(self, key: tuple) -> pd.DataFrame | None:
+        if not self.persist:
+            return None
+        df = Cache.get_instance(self.cache_file_name).get(self._signature(key))
+        if df is not None:
+            logger.debug(f"found cached rollup {key} for {self.fingerprint[:8]}")
+        return df
+
+    def _store(self, key: tuple, df: pd.DataFrame) -> None:
+        if self.persist:
+            Cache.get_instance(self.cache_file_name).set(self._signature(key), df)
@@ -3,22 +3,31 @@ from __future__ import (
 )  # required to avoid circular imports for typing purposes
 
 import asyncio
+import dataclasses
 import datetime
-import pickle
-import re
-import shelve
+import hashlib
+import inspect
+import json
+import os
+import threading
 import time
-import zlib
 from abc import ABC, abstractmethod
-from collections import defaultdict
-from typing import Type, Annotated, Iterable, Callable, Union, Generator, Any, Protocol
-import metrics_collector
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future, Executor, ThreadPoolExecutor, ProcessPoolExecutor, wait
+from typing import Type, Annotated, Iterable, Callable, Union, Generator, AsyncGenerator, Any, Protocol, Literal
 from enum import Enum, auto
 from typing import TYPE_CHECKING
 from loguru import logger
-from functools import wraps
+from functools import wraps, partial
+from types import MappingProxyType
 
-from metrics_collector.utils import get_days_between, get_data_dir, normalize_period
+from metrics_collector.__version__ import __version__
+from metrics_collector.exceptions import MetricsRenderException
+from metrics_collector.orchestrator.progress import ProgressEvent, ProgressTracker
+from metrics_collector.plugins import load_plugins
+from metrics_collector.storage.cache import Cache
+from metrics_collector.utils import get_days_between, normalize_period, to_date
 
 if TYPE_CHECKING:
     from metrics_collector.extract.base import (
@@ -38,80 +47,213 @@ class ClassType(str, Enum):
     load = auto()
 
 
-class Staller:
-    """Class meant for stall execution such case call already in progress to avoid congestions.
-    Need no instantiation (compared to singleton)
+class _Abandoned(Exception):
+    """The computing caller was cancelled, one of the waiting callers takes over"""
+
+
+class SingleFlight:
+    """Coalesce concurrent calls of the same signature into one computation.
+    The first caller computes while the others (sync or async) wait for the same result or exception,
+    up to env SINGLE_FLIGHT_TIMEOUT seconds. If the first caller is cancelled a waiting one computes instead.
     """
 
-    _running_jobs: dict[
-        Annotated[str, "function name, args, kwargs"], Annotated[int, "time started"]
-    ] = {}
-    expire_secs = 180
-    clean_up_hours = 6
+    _in_flight: dict[Annotated[str, "signature"], Future] = {}
+    _lock = threading.Lock()
+    timeout = int(os.getenv("SINGLE_FLIGHT_TIMEOUT", 600))
 
     @classmethod
-    def sync_stall(cls, function, arg, kwargs, default=None, expire_after=expire_secs):
-        """Use for sync mode"""
-        cls._pre_stall(arg, function, kwargs)
-        if not cls._is_running(function, arg, kwargs):
-            return default
-        else:
-            cls._running_jobs[cls._get_signature(function, arg, kwargs)] = cls._now()
-            for _ in range(expire_after):
-                time.sleep(1)
-        return default
+    def _join(cls, signature: str) -> tuple[Future, bool]:
+        """Future of the call in flight for signature, and whether caller is the one to compute it"""
+        with cls._lock:
+            if (future := cls._in_flight.get(signature, None)) is not None:
+                logger.debug(f"waiting for {signature} already in flight")
+                return future, False
+            cls._in_flight[signature] = future = Future()
+            return future, True
 
     @classmethod
-    async def async_stall(
-        cls, function, arg, kwargs, default=None, expire_after=expire_secs
-    ):
-        """Use for async mode"""
-        cls._pre_stall(arg, function, kwargs)
-        if not cls._is_running(function, arg, kwargs):
-            return default
+    def _done(cls, signature: str, future: Future, result=None, exception: BaseException | None = None):
+        with cls._lock:
+            cls._in_flight.pop(signature, None)
+        if exception is not None:
+            future.set_exception(exception)
         else:
-            cls._running_jobs[cls._get_signature(function, arg, kwargs)] = cls._now()
-            for _ in range(expire_after):
-                await asyncio.sleep(1)
-        return default
+            future.set_result(result)
 
     @classmethod
-    def _get_signature(cls, func, args, kwargs):
-        return re.sub(r" object at \w+", "", f"{func.__name__} {args} {kwargs}")
+    def _waited(cls, signature: str, future: Future):
+        if not future.done():
+            raise TimeoutError(f"{signature} still in flight after {cls.timeout}s")
+        return future.result()
 
     @classmethod
-    def _pre_stall(cls, arg, function, kwargs):
-        cls._remove_long_running()
-        logger.info(
-            f"currently {len(cls._running_jobs)} currently running using function {function.__name__}"
-        )
-        if remaining_time := cls._get_stall_time(function, arg, kwargs):
-            logger.debug(
-                f"will stall {function}({arg}, {kwargs}) for {remaining_time} secs"
-            )
-        else:
-            logger.debug(f"not stalling {function.__name__} not currently working")
+    def do(cls, signature: str, function: Callable, *args, **kwargs):
+        """Call function unless already in flight, in that case wait for its result"""
+        future, leader = cls._join(signature)
+        while not leader:
+            wait([future], cls.timeout)
+            try:
+                return cls._waited(signature, future)
+            except _Abandoned:
+                future, leader = cls._join(signature)
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            cls._done(signature, future, exception=e)
+            raise
+        except BaseException:  # e.g. cancelled, not an outcome to share
+            cls._done(signature, future, exception=_Abandoned(signature))
+            raise
+        cls._done(signature, future, result)
+        return result
+
+    @classmethod
+    async def ado(cls, signature: str, function: Callable, *args, **kwargs):
+        """Same as do() for async callers, function may either be sync or async"""
+        future, leader = cls._join(signature)
+        while not leader:
+            # asyncio.wait() leaves the shared future untouched when this caller is cancelled
+            await asyncio.wait([asyncio.wrap_future(future)], timeout=cls.timeout)
+            try:
+                return cls._waited(signature, future)
+            except _Abandoned:
+                future, leader = cls._join(signature)
+        try:
+            result = function(*args, **kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+        except Exception as e:
+            cls._done(signature, future, exception=e)
+            raise
+        except BaseException:  # e.g. cancelled, not an outcome to share
+            cls._done(signature, future, exception=_Abandoned(signature))
+            raise
+        cls._done(signature, future, result)
+        return result
+
+    @classmethod
+    def in_flight(cls) -> int:
+        with cls._lock:
+            return len(cls._in_flight)
+
+    @classmethod
+    def _reset_after_fork(cls) -> None:
+        """Forget calls in flight within the parent, nobody in a forked child would ever complete them"""
+        cls._in_flight = {}
+        cls._lock = threading.Lock()
+
+
+class Executors:
+    """Process-wide executors keeping blocking work off the event loop.
+    CPU-bound work (transform and graphs) runs within threads or processes by env ORCHESTRATOR_EXECUTOR
+    ("thread" or "process"), blocking I/O (extracting from services) always within threads.
+    """
+
+    _executors: dict[Annotated[str, "cpu or io"], Executor] = {}
+    _lock = threading.Lock()
 
     @classmethod
-    def _get_stall_time(cls, function, args, kwargs) -> int:
-        sign = cls._get_signature(function, args, kwargs)
-        if start_time := cls._running_jobs.get(sign, None):
-            remaining_secs = cls._now() - start_time
-            return remaining_secs if remaining_secs > 0 else None
+    def get(cls, kind: Literal["cpu", "io"]) -> Executor:
+        with cls._lock:
+            if kind not in cls._executors:
+                cls._executors[kind] = cls._create(kind)
+            return cls._executors[kind]
 
     @classmethod
-    def _remove_long_running(cls):
-        for args, start_time in cls._running_jobs.items():
-            if cls._now() > int(start_time) + cls.clean_up_hours * 3600:
-                cls._running_jobs.pop(args)
+    def set(cls, kind: Literal["cpu", "io"], executor: Executor) -> None:
+        """Replace executor e.g. by one with more workers"""
+        with cls._lock:
+            if previous := cls._executors.get(kind, None):
+                previous.shutdown(wait=False)
+            cls._executors[kind] = executor
+
+    @staticmethod
+    def _create(kind: str) -> Executor:
+        if kind == "io":
+            return ThreadPoolExecutor(int(os.getenv("ORCHESTRATOR_IO_WORKERS", 8)), thread_name_prefix="io")
+        workers = int(os.getenv("ORCHESTRATOR_WORKERS", min(4, os.cpu_count() or 1)))
+        if os.getenv("ORCHESTRATOR_EXECUTOR", "thread") == "process":
+            return ProcessPoolExecutor(workers)
+        return ThreadPoolExecutor(workers, thread_name_prefix="cpu")
 
     @classmethod
-    def _is_running(cls, function, args, kwargs):
-        return cls._get_signature(function, args, kwargs) in cls._running_jobs
+    def is_process(cls, kind: Literal["cpu", "io"]) -> bool:
+        """Whether work of kind runs within other processes, i.e. arguments and results are pickled"""
+        return isinstance(cls.get(kind), ProcessPoolExecutor)
 
     @classmethod
-    def _now(cls):
-        return int(time.time())
+    async def run(cls, kind: Literal["cpu", "io"], function: Callable, *args, **kwargs):
+        """Await function called within the executor of kind"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(cls.get(kind), partial(function, *args, **kwargs))
+
+    @classmethod
+    def _reset_after_fork(cls) -> None:
+        """Executors of the parent have no worker in a forked child"""
+        cls._executors = {}
+        cls._lock = threading.Lock()
+
+
+class PipelineMemo:
+    """Bounded memo of load instances (processed pipeline results) shared by graph requests of the process."""
+
+    _entries: OrderedDict[
+        Annotated[tuple, "dag name, from, to, data version"],
+        dict[Annotated[frozenset | None, "graph names or None for all"], BaseLoadGraph],
+    ] = OrderedDict()
+    _key_locks: dict[tuple, threading.Lock] = {}
+    _lock = threading.Lock()
+    max_entries = 8
+
+    @classmethod
+    def get(
+        cls,
+        key: tuple,
+        graph_names: Iterable[str] | None,
+        factory: Callable[[frozenset | None], BaseLoadGraph],
+    ) -> BaseLoadGraph:
+        """Get existing load instance covering graph_names or create it by factory(graph_names).
+        Once a second subset of graphs is requested for the same key the full pipeline is processed
+        so that any following graph of e.g. a dashboard reuse it."""
+        graph_names = frozenset(graph_names) if graph_names else None
+        with cls._lock:
+            key_lock = cls._key_locks.setdefault(key, threading.Lock())
+        with key_lock:  # concurrent requests for same key wait rather than process in parallel
+            with cls._lock:
+                instances = cls._entries.get(key, {})
+                if key in cls._entries:
+                    cls._entries.move_to_end(key)
+                existing = instances.get(None, None) or instances.get(graph_names, None)
+            if existing:
+                logger.debug(f"reusing processed pipeline for {key} {graph_names or ''}")
+                return existing
+            if instances:
+                graph_names = None
+            load_instance = factory(graph_names)
+            with cls._lock:
+                cls._entries.setdefault(key, {})[graph_names] = load_instance
+                cls._entries.move_to_end(key)
+                while len(cls._entries) > cls.max_entries:
+                    evicted, _ = cls._entries.popitem(last=False)
+                    cls._key_locks.pop(evicted, None)
+                    logger.debug(f"evicting processed pipeline for {evicted}")
+            return load_instance
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
+            cls._key_locks.clear()
+
+    @classmethod
+    def _reset_after_fork(cls) -> None:
+        """Locks may be held by threads of the parent which don't exist in a forked child"""
+        cls._key_locks = {}
+        cls._lock = threading.Lock()
+
+
+for _shared in (SingleFlight, Executors, PipelineMemo):
+    os.register_at_fork(after_in_child=_shared._reset_after_fork)
 
 
 class ProgressBar(ABC):
@@ -124,55 +266,217 @@ class ProgressBar(ABC):
         """Updates its status"""
         ...
 
+    def on_progress(self, event: ProgressEvent) -> None:
+        """Subscriber of progress events, override for presenting more than the overall progress"""
+        self.update(event.overall_progress)
 
-def caching(func):
-    """Custom caching (memoize) that supports either sync or async"""
 
-    @wraps(func)
-    def cache_function(*args, **kwargs):
-        # TODO: RuntimeWarning: coroutine 'Staller.stall' was never awaited
-        data_dir = get_data_dir()
-        cache_file = f"{data_dir}/graph_cache"
+_not_cached = object()
+
+
+def caching(func=None, *, key: Callable[..., tuple] | None = None, rekey: bool = False):
+    """Custom caching (memoize) that supports either sync or async.
+    Use key for deriving the cache key from the arguments, otherwise cached for the same day and arguments.
+    Use rekey for storing by the key derived after the call, for calls changing what the key is derived from
+
+    Example:
+        @caching(key=lambda dag_name, data_version: ("my_func", dag_name, data_version))
+        def my_func(dag_name, data_version):
+            ...
+    """
+    if func is None:
+        return partial(caching, key=key, rekey=rekey)
+
+    def get_signature(args, kwargs) -> tuple[str, float | None]:
+        if key:
+            return f"{key(*args, **kwargs)}", None
         today = datetime.date.today()
-        signature = f"[{today}, {func.__name__}({args})]"
-        s = shelve.open(cache_file)
-        existing: bytes | None = s.get(signature, None)
-        if existing:
-            result = pickle.loads(zlib.decompress(existing))
-            s.close()
-            logger.debug(
-                f"found cached data {len(result) if result else 0} bytes for {signature}"
-            )
-            return result
-        else:
-            result = func(*args, **kwargs)
-            compressed = zlib.compress(pickle.dumps(result))
-            s[signature] = compressed
+        return f"[{today}, {func.__name__}({args})]", datetime.timedelta(days=1).total_seconds()
+
+    def lookup(signature):
+        existing = Cache.get_instance("graph_cache").get(signature, _not_cached)
+        if existing is not _not_cached:
             logger.debug(
-                f"caching and compressing from {len(result) if result else 0} bytes -> {len(compressed)} bytes for {signature}"
+                f"found cached data {len(existing) if existing else 0} bytes for {signature}"
             )
-            s.close()
-            return result
+        return existing
+
+    def store(signature, ttl, result):
+        compressed_size = Cache.get_instance("graph_cache").set(signature, result, ttl=ttl)
+        logger.debug(
+            f"caching and compressing from {len(result) if result else 0} bytes -> {compressed_size} bytes for {signature}"
+        )
+
+    def cache_function(signature, ttl, *args, **kwargs):
+        if (existing := lookup(signature)) is not _not_cached:
+            return existing
+        result = func(*args, **kwargs)
+        store(get_signature(args, kwargs)[0] if rekey else signature, ttl, result)
+        return result
+
+    async def async_cache_function(signature, ttl, *args, **kwargs):
+        if (existing := await asyncio.to_thread(lookup, signature)) is not _not_cached:
+            return existing
+        result = await func(*args, **kwargs)
+        if rekey:
+            signature = await asyncio.to_thread(lambda: get_signature(args, kwargs)[0])
+        await asyncio.to_thread(store, signature, ttl, result)
+        return result
 
+    @wraps(func)
     def sync_cache(*args, **kwargs):
-        Staller.sync_stall(func, args, kwargs)
-        return cache_function(*args, **kwargs)
+        signature, ttl = get_signature(args, kwargs)
+        return SingleFlight.do(signature, cache_function, signature, ttl, *args, **kwargs)
 
+    @wraps(func)
     async def async_cache(*args, **kwargs):
-        await Staller.async_stall(func, args, kwargs)
-        return cache_function(*args, **kwargs)
+        signature, ttl = get_signature(args, kwargs)
+        return await SingleFlight.ado(signature, async_cache_function, signature, ttl, *args, **kwargs)
 
-    if asyncio.iscoroutine(func):
+    if inspect.iscoroutinefunction(func):
         return async_cache
     else:
         return sync_cache
 
 
-def register_dag_name(cls):
+def _graph_cache_key(
+    self, graph_name, from_, to_, dag_name, transform_object, format_="html", pipeline_graphs=()
+) -> tuple:
+    """Graph is the same as long as the extracted data is, regardless of what day it is"""
+    return (
+        "get_graph",
+        __version__,
+        dag_name,
+        graph_name,
+        getattr(format_, "value", format_),
+        to_date(from_),
+        to_date(to_),
+        transform_object.data_version,
+    )
+
+
+shared_transform_object_ttl = 86400
+
+
+def _transform_object_cache_key(dag_name, data_version) -> str:
+    return f"{('transform_object', __version__, dag_name, data_version)}"
+
+
+def _get_graph_in_process(graph_name, from_, to_, dag_name, data_version, format_="html", pipeline_graphs=()) -> Any:
+    """Render graph within a process executor, its transform object (and processed pipeline) kept by the worker"""
+    transform_object = Cache.get_instance("graph_cache").get(_transform_object_cache_key(dag_name, data_version), None)
+    if transform_object is None:
+        raise MetricsRenderException(f"transform object of {dag_name} {data_version} no longer shared")
+    return Orchestrator()._get_graph(graph_name, from_, to_, dag_name, transform_object, format_, pipeline_graphs)
+
+
+def _parameters_hash(extract_object) -> str:
+    """Hash of the parameters of extract_object, leaving out secrets such as passwords"""
+    params = getattr(extract_object, "parameters", None) or {}
+    params = params if isinstance(params, dict) else vars(params)
+    public = sorted((k, f"{v}") for k, v in params.items() if "password" not in k.lower())
+    return hashlib.sha1(repr(public).encode()).hexdigest()[:16]
+
+
+def _process_dates_cache_key(extract_objects, from_, to_, progress_bar=None) -> tuple:
+    """Dates are processed once the extracted data (of the same parameters) covers them, new data invalidate it.
+    Taken again once processed, as processing itself may change the data version"""
+    return (
+        "process_dates",
+        to_date(from_),
+        to_date(to_),
+        tuple(
+            (_.__class__.__name__, _parameters_hash(_), _.get_data_version()) for _ in extract_objects
+        ),
+    )
+
+
+@dataclasses.dataclass(frozen=True)
+class DagPlan:
+    """Immutable plan of a dag with its classes, parameters and graph names resolved as classes are registered"""
+
+    dag_name: str
+    extract_classes: tuple[Type[BaseExtract], ...] = ()
+    extract_parameters: MappingProxyType[Type[BaseExtract], parameter_dict] = dataclasses.field(
+        default_factory=lambda: MappingProxyType({})
+    )
+    transform_class: Type[BaseTransform] | None = None
+    load_classes: tuple[Type[BaseLoadGraph], ...] = ()
+    graph_names: tuple[str, ...] = ()
+
+    @property
+    def load_class(self) -> Type[BaseLoadGraph] | None:
+        return next(iter(self.load_classes), None)
+
+    def with_class(self, cls: Type, class_type: ClassType) -> DagPlan:
+        """New plan including cls, the first transform class registered is used"""
+        match class_type:
+            case ClassType.extract:
+                return dataclasses.replace(
+                    self,
+                    extract_classes=(*self.extract_classes, cls),
+                    extract_parameters=MappingProxyType({**self.extract_parameters, cls: MappingProxyType(cls.get_parameters())}),
+                )
+            case ClassType.transform:
+                return self if self.transform_class else dataclasses.replace(self, transform_class=cls)
+            case ClassType.load:
+                return dataclasses.replace(
+                    self,
+                    load_classes=(*self.load_classes, cls),
+                    graph_names=(*self.graph_names, *(_.__name__ for _ in cls.get_all_graph_methods(cls))),
+                )
+
+
+def _get_registries() -> tuple[defaultdict[str, list[Type]], dict[str, DagPlan]]:
+    """Registries as is, not loading plugins as classes are registered in the order imported"""
+    return vars(Orchestrator)["registered_etl_entities"].value, vars(Orchestrator)["dag_plans"].value
+
+
+@contextmanager
+def restored_registry():
+    """Registry restored as exiting, forgetting classes registered within such as those declared by tests
+
+    Example:
+        with restored_registry():
+            class FooExtract(BaseExtract):
+                dag_name = "foo"
+                ...
+    """
+    load_plugins()  # plugins imported within would otherwise never be registered again
+    registered_etl_entities, dag_plans = _get_registries()
+    saved_entities = {k: list(v) for k, v in registered_etl_entities.items()}
+    saved_plans = dict(dag_plans)
+    try:
+        yield
+    finally:
+        registered_etl_entities.clear()
+        registered_etl_entities.update(saved_entities)
+        dag_plans.clear()
+        dag_plans.update(saved_plans)
+
+
+def register_dag_name(cls, class_type: ClassType):
     c = cls.dag_name
     names = (c,) if isinstance(c, str) else c
+    registered_etl_entities, dag_plans = _get_registries()
+    registered = {_ for classes in registered_etl_entities.values() for _ in classes}
     for _ in names:
-        Orchestrator.registered_etl_entities[_].append(cls)
+        registered_etl_entities[_].append(cls)
+        if cls.__base__ in registered:
+            continue  # subclasses of registered classes are not part of the plan, same as before
+        plan = dag_plans.get(_, None) or DagPlan(_)
+        dag_plans[_] = plan.with_class(cls, class_type)
+
+
+class _Registry:
+    """Class attribute of registered classes, plugins declaring them are loaded as first accessed"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __get__(self, instance, owner):
+        load_plugins()
+        return self.value
 
 
 class Orchestrator:
@@ -194,14 +498,10 @@ class Orchestrator:
 
     registered_etl_entities: defaultdict[
         Annotated[str, "dag name"], list[Annotated[Type, "classes"]]
-    ] = defaultdict(list)
+    ] = _Registry(defaultdict(list))
+    dag_plans: dict[Annotated[str, "dag name"], DagPlan] = _Registry({})
 
     def __init__(self):
-        self.type = {
-            ClassType.extract: metrics_collector.extract.base.BaseExtract,
-            ClassType.transform: metrics_collector.transform.base.BaseTransform,
-            ClassType.load: metrics_collector.load.base.BaseLoadGraph,
-        }
         current_processes = {}
 
     def __repr__(self):
@@ -209,41 +509,37 @@ class Orchestrator:
 
     def get_dag_names(self) -> list:
         """Get what registered services"""
-        return list(self.registered_etl_entities.keys())
+        return list(self.dag_plans.keys())
+
+    def get_dag_plan(self, dag_name: str) -> DagPlan:
+        """Get classes, parameters and graph names of dag_name"""
+        return self.dag_plans.get(dag_name, None) or DagPlan(dag_name)
 
     def get_extract_services_and_parameters(
         self,
     ) -> dict[Annotated[str, "dag_name"], dict[str, parameter_dict]]:
         """Get what registered services and their parameters"""
-        result = defaultdict(dict)
-        for dag_name in self.registered_etl_entities.keys():
-            extract_classes = self._get_registered_classes(dag_name, ClassType.extract)
-            for cls in extract_classes:
-                result[dag_name][cls] = cls.get_parameters()
-        return result
+        return {
+            dag_name: dict(plan.extract_parameters)
+            for dag_name, plan in self.dag_plans.items()
+            if plan.extract_parameters
+        }
 
     def get_graph_names(self, dag_name: str) -> list[str]:
-        extract_classes = self._get_registered_classes(dag_name, ClassType.load)
-        methods = []
-        for cls in extract_classes:
-            for m in cls.get_all_graph_methods(cls):
-                methods.append(m.__name__)
-        return methods
+        return list(self.get_dag_plan(dag_name).graph_names)
 
     def _get_registered_classes(
         self, dag_name, class_type: ClassType, only_first=False
     ) -> list[Type[BaseExtract] | Type[BaseTransform] | Type[BaseLoadGraph]] | Type[
         BaseExtract
     ] | Type[BaseTransform] | Type[BaseLoadGraph]:
-        logger.debug(f"starting {__name__=}")
-        classes = [
-            cls
-            for cls in self.registered_etl_entities.get(dag_name, [])
-            if cls.__base__ is self.type.get(class_type, None)
-        ]
-        logger.debug("done get classes")
-        result = next(iter(classes), None) if only_first else classes
-        return result
+        plan = self.get_dag_plan(dag_name)
+        classes = {
+            ClassType.extract: plan.extract_classes,
+            ClassType.transform: (plan.transform_class,) if plan.transform_class else (),
+            ClassType.load: plan.load_classes,
+        }[class_type]
+        return next(iter(classes), None) if only_first else list(classes)
 
     @staticmethod
     def _dict_to_extract_params_object(
@@ -267,19 +563,15 @@ class Orchestrator:
 
     def get_extract_params_def(self, dag_name):
         """Used to e.g. pass to UI to request params from use"""
-        args = self.get_extract_services_and_parameters()
-        extract_classes = self._get_registered_classes(dag_name, ClassType.extract)
-        for extract_class in extract_classes:
-            yield args[dag_name][extract_class]
+        yield from self.get_dag_plan(dag_name).extract_parameters.values()
 
     def get_extract_objects(self, dag_name, extract_params: dict):
         """Main entrypoint for getting extract objects used to get transformer object"""
         # create extract objects
-        args = self.get_extract_services_and_parameters()
-        extract_classes = self._get_registered_classes(dag_name, ClassType.extract)
+        plan = self.get_dag_plan(dag_name)
         extract_objects = []
-        for extract_class in extract_classes:
-            extract_args = args[dag_name][extract_class]
+        for extract_class in plan.extract_classes:
+            extract_args = plan.extract_parameters[extract_class]
             logger.debug(f"get arguments for {extract_class=} which is {extract_args}")
             p = self._dict_to_extract_params_object(extract_params, extract_class)
             extract_object = extract_class(p)  # add args
@@ -291,12 +583,36 @@ class Orchestrator:
     ) -> BaseTransform:
         """Main entrypoint for getting transform object used to load graph from"""
         # create transform object
-        transformer_class = self._get_registered_classes(
-            dag_name, ClassType.transform, only_first=True
-        )
+        transformer_class = self.get_dag_plan(dag_name).transform_class
         transformer_object = transformer_class(*extract_objects)
         return transformer_object
 
+    async def aget_transform_object(
+        self, dag_name: str, extract_objects: list
+    ) -> BaseTransform:
+        """Async counterpart of get_transform_object, merging extracted data within the executor.
+        Within a thread when processes are used, the transform object is shared to them by the cache instead"""
+        kind = "io" if Executors.is_process("cpu") else "cpu"
+        return await Executors.run(kind, self.get_transform_object, dag_name, extract_objects)
+
+    def get_load_instance(
+        self,
+        from_: datetime.date | str,
+        to_: datetime.date | str,
+        dag_name: str,
+        transform_object: BaseTransform,
+        graph_names: Iterable[str] | None = None,
+    ) -> BaseLoadGraph:
+        """Get load instance with processed pipeline, reused for same dag, period and source data"""
+        load_class: Type[BaseLoadGraph] = self.get_dag_plan(dag_name).load_class
+        from_, to_ = normalize_period(from_, to_)
+        key = (dag_name, to_date(from_), to_date(to_), transform_object.data_version)
+        return PipelineMemo.get(
+            key,
+            graph_names,
+            lambda names: load_class(transform_object, from_, to_, graph_names=names),
+        )
+
     def get_all_graphs(
         self,
         from_: datetime.date | str,
@@ -306,15 +622,30 @@ class Orchestrator:
         format: Annotated[str, "Type such as `html` or `png`"] = "html",
     ) -> Generator[Any, None, None]:
         """Main entrypoint for getting all graph objects with methods such as .to_htm() or .to_png()"""
-        load_class: Type[BaseLoadGraph] = self._get_registered_classes(
-            dag_name, ClassType.load, only_first=True
-        )
-        from_, to_ = normalize_period(from_, to_)
-        load_instance = load_class(transform_object, from_, to_)
-        for graph in load_instance.get_all_graph_methods():
-            yield getattr(load_instance, f"to_{format}")(graph)
+        load_instance = self.get_load_instance(from_, to_, dag_name, transform_object)
+        yield from load_instance.get_all_graphs(format)
 
-    @caching
+    async def aget_all_graphs(
+        self,
+        from_: datetime.date | str,
+        to_: datetime.date | str,
+        dag_name: str,
+        transform_object: BaseTransform,
+        format: Annotated[str, "Type such as `html` or `png`"] = "html",
+    ) -> AsyncGenerator[Any, None]:
+        """Async counterpart of get_all_graphs, graphs rendered concurrently and yielded in order"""
+        tasks = [
+            asyncio.ensure_future(self.aget_graph(_, from_, to_, dag_name, transform_object, format, None))
+            for _ in self.get_graph_names(dag_name)
+        ]
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @caching(key=_graph_cache_key)
     def get_graph(
         self,
         graph_name: str,
@@ -323,14 +654,50 @@ class Orchestrator:
         dag_name: str,
         transform_object: BaseTransform,
         format_: Annotated[str, "Type such as `html` or `png`"] = "html",
+        pipeline_graphs: Annotated[Iterable[str] | None, "graphs processed along, None for all"] = (),
     ) -> Any:
         """Main entrypoint for getting all graph objects with methods such as .to_htm() or .to_png()"""
-        load_class: Type[BaseLoadGraph] = self._get_registered_classes(
-            dag_name, ClassType.load, only_first=True
+        return self._get_graph(graph_name, from_, to_, dag_name, transform_object, format_, pipeline_graphs)
+
+    @caching(key=_graph_cache_key)
+    async def aget_graph(
+        self,
+        graph_name: str,
+        from_: datetime.date | str,
+        to_: datetime.date | str,
+        dag_name: str,
+        transform_object: BaseTransform,
+        format_: Annotated[str, "Type such as `html` or `png`"] = "html",
+        pipeline_graphs: Annotated[Iterable[str] | None, "graphs processed along, None for all"] = (),
+    ) -> Any:
+        """Async counterpart of get_graph sharing its cache, processing and rendering within the executor.
+        Use pipeline_graphs when rendering several graphs, processing the pipeline once for all of them"""
+        if Executors.is_process("cpu"):  # only keys are passed, the worker gets the data from the shared cache
+            await asyncio.to_thread(self.share_transform_object, dag_name, transform_object)
+            return await Executors.run(
+                "cpu", _get_graph_in_process, graph_name, from_, to_, dag_name, transform_object.data_version, format_, pipeline_graphs
+            )
+        return await Executors.run(
+            "cpu", self._get_graph, graph_name, from_, to_, dag_name, transform_object, format_, pipeline_graphs
+        )
+
+    _shared_transform_objects: dict[Annotated[str, "cache key"], float] = {}
+
+    @classmethod
+    def share_transform_object(cls, dag_name: str, transform_object: BaseTransform) -> None:
+        """Store transform object once per data version for processes rendering graphs of it"""
+        key = _transform_object_cache_key(dag_name, transform_object.data_version)
+        now = time.time()
+        if cls._shared_transform_objects.get(key, 0) > now:
+            return
+        Cache.get_instance("graph_cache").set(key, transform_object, ttl=shared_transform_object_ttl)
+        cls._shared_transform_objects[key] = now + shared_transform_object_ttl / 2  # stored again before expiring
+
+    def _get_graph(self, graph_name, from_, to_, dag_name, transform_object, format_="html", pipeline_graphs=()) -> Any:
+        graph_names = None if pipeline_graphs is None else {graph_name, *pipeline_graphs}
+        load_instance = self.get_load_instance(
+            from_, to_, dag_name, transform_object, graph_names=graph_names
         )
-        logger.debug("done get registered classes")
-        logger.debug(f"{load_class=}")
-        load_instance = load_class(transform_object, from_, to_)
         logger.debug(f"{load_instance=}")
         for graph in load_instance.get_all_graph_methods():
             logger.debug(f"{graph=}")
@@ -338,24 +705,46 @@ class Orchestrator:
                 return getattr(load_instance, f"to_{format_}")(graph)
 
     @staticmethod
-    @caching
+    def get_missing_days(
+        extract_objects, from_, to_
+    ) -> dict[BaseExtract, list[Annotated[str, "date"]]]:
+        """Days of the period not yet extracted and cached for each extract object"""
+        dates = list(get_days_between(from_, to_))
+        return {_: _.get_missing_days(dates) for _ in extract_objects}
+
+    @staticmethod
+    @caching(key=_process_dates_cache_key, rekey=True)
     def process_dates(
         extract_objects, from_, to_, progress_bar: ProgressBar | None = None
     ):
         """Method of assure data retrieved from service for the period given"""
+        return Orchestrator._process_dates(extract_objects, from_, to_, progress_bar)
+
+    @staticmethod
+    @caching(key=_process_dates_cache_key, rekey=True)
+    async def aprocess_dates(
+        extract_objects, from_, to_, progress_bar: ProgressBar | None = None
+    ):
+        """Async counterpart of process_dates, retrieving from services within the I/O executor"""
+        return await Executors.run("io", Orchestrator._process_dates, extract_objects, from_, to_, progress_bar)
+
+    @staticmethod
+    def _process_dates(extract_objects, from_, to_, progress_bar: ProgressBar | None = None):
         dates = list(get_days_between(from_, to_))
-        tot = len(list(dates)) * len(extract_objects)
-        for idx_extract, extract_object in enumerate(extract_objects, start=1):
-            for idx_date, date in enumerate(dates):
-                current_count = idx_date * idx_extract
-                logger.info(f"downloading {current_count}/{tot} [{extract_object}]")
-                extract_object.get_data(
+        missing_days = Orchestrator.get_missing_days(extract_objects, from_, to_)
+        tracker = ProgressTracker(
+            {_.__class__.__name__: len(dates) for _ in extract_objects},
+            subscribers=[progress_bar.on_progress] if progress_bar else [],
+        )
+        for extract_object in extract_objects:
+            missing = set(missing_days[extract_object])
+            for date in dates:
+                data = extract_object.get_data(
                     date
                 )  # This could also be changed to different context
-                if progress_bar:
-                    try:
-                        progress_bar.update(current_count / tot)
-                    except Exception as e:
-                        logger.error(f'error updating progress bar: {e}')
-                        if "Can't find current session" in f"{e}":
-                            logger.info('Web browser session most likely disconnected and this process will continue in background till completion')
+                fetched = date in missing
+                tracker.advance(
+                    extract_object.__class__.__name__,
+                    cached=not fetched,
+                    bytes_fetched=len(json.dumps(data, default=str)) if fetched else 0,
+                )
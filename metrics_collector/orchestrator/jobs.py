@@ -0,0 +1,167 @@
+import asyncio
+import dataclasses
+import os
+import time
+import uuid
+from enum import Enum
+from typing import Annotated, Any, AsyncGenerator, Awaitable, Callable, Hashable
+
+from loguru import logger
+
+from metrics_collector.orchestrator.generic import ProgressBar
+
+
+class JobStatus(str, Enum):
+    pending = "pending"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+@dataclasses.dataclass
+class Job:
+    """Background job with its status, progress and result once done"""
+
+    key: Annotated[Hashable, "identical jobs share key"]
+    media_type: str = "application/json"
+    id: str = dataclasses.field(default_factory=lambda: uuid.uuid4().hex)
+    status: JobStatus = JobStatus.pending
+    progress: Annotated[float, "Between 0 and 1"] = 0.0
+    error: str | None = None
+    result: Any = dataclasses.field(default=None, repr=False)
+    created: float = dataclasses.field(default_factory=time.time)
+    finished: float | None = None
+    _changed: asyncio.Event = dataclasses.field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (JobStatus.done, JobStatus.failed)
+
+    def update(self, **changes) -> None:
+        """Update fields and wake up those waiting for changes, call within the event loop"""
+        for name, value in changes.items():
+            setattr(self, name, value)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_changed(self, timeout: float | None = None) -> bool:
+        """Wait for next update, False if timed out"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def asdict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status.value,
+            "progress": round(self.progress, 3),
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class JobProgressBar(ProgressBar):
+    """Progress bar updating the progress of a job, safe to update from executor threads"""
+
+    def __init__(self, job: Job, loop: asyncio.AbstractEventLoop | None = None):
+        self.job = job
+        self.loop = loop or asyncio.get_running_loop()
+
+    def update(self, progress: Annotated[float, "Between 0 and 1"]) -> None:
+        self.loop.call_soon_threadsafe(lambda: self.job.update(progress=progress))
+
+
+JobFunction = Callable[[JobProgressBar], Awaitable[Any]]
+
+
+class JobQueue:
+    """Background queue of heavy requests, returning a job to poll or subscribe to.
+    Identical pending or running jobs share the same job, finished jobs are kept for retention_secs.
+    Its workers are tasks of the running event loop, started as jobs are submitted.
+
+    Example:
+        queue = JobQueue.get_instance()
+        job = await queue.submit(("graph", dag_name, ...), lambda progress_bar: render(progress_bar))
+        async for status in queue.events(job.id):
+            ...
+        queue.get(job.id).result
+    """
+
+    _instance = None
+
+    def __init__(
+        self,
+        workers: Annotated[int | None, "defaults to env JOB_WORKERS or 2"] = None,
+        retention_secs: Annotated[int | None, "defaults to env JOB_RETENTION_SECS or 3600"] = None,
+    ):
+        self.workers = workers or int(os.getenv("JOB_WORKERS", 2))
+        self.retention_secs = retention_secs or int(os.getenv("JOB_RETENTION_SECS", 3600))
+        self.jobs: dict[Annotated[str, "job id"], Job] = {}
+        self._pending: dict[Hashable, Job] = {}
+        self._queue: asyncio.Queue[tuple[Job, JobFunction]] = asyncio.Queue()
+        self._worker_tasks: list[asyncio.Task] = []
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(workers={self.workers}, jobs={len(self.jobs)}, queued={self._queue.qsize()})"
+
+    @classmethod
+    def get_instance(cls) -> "JobQueue":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def _start_workers(self) -> None:
+        self._worker_tasks = [_ for _ in self._worker_tasks if not _.done()]
+        for _ in range(self.workers - len(self._worker_tasks)):
+            self._worker_tasks.append(asyncio.create_task(self._worker()))
+
+    async def submit(self, key: Hashable, function: JobFunction, media_type: str = "application/json") -> Job:
+        """Enqueue function(progress_bar) unless an identical job is already pending or running"""
+        self._purge()
+        if (job := self._pending.get(key, None)) is not None:
+            logger.debug(f"job {job.id} already {job.status.value} for {key}")
+            return job
+        job = Job(key, media_type)
+        self.jobs[job.id] = self._pending[key] = job
+        self._start_workers()
+        await self._queue.put((job, function))
+        logger.info(f"queued job {job.id}, {self._queue.qsize()} in queue")
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        self._purge()
+        return self.jobs.get(job_id, None)
+
+    async def events(self, job_id: str, heartbeat_secs: float = 15) -> AsyncGenerator[dict, None]:
+        """Status of job as it changes (or as heartbeat) until finished"""
+        if (job := self.get(job_id)) is None:
+            return
+        while True:
+            yield job.asdict()
+            if job.is_finished:
+                return
+            await job.wait_changed(heartbeat_secs)
+
+    async def _worker(self) -> None:
+        while True:
+            job, function = await self._queue.get()
+            job.update(status=JobStatus.running)
+            try:
+                result = await function(JobProgressBar(job))
+            except Exception as e:
+                logger.error(f"job {job.id} failed: {e}")
+                job.update(status=JobStatus.failed, error=str(e), finished=time.time())
+            else:
+                job.update(status=JobStatus.done, progress=1.0, result=result, finished=time.time())
+            finally:
+                self._pending.pop(job.key, None)
+                self._queue.task_done()
+
+    def _purge(self) -> None:
+        expired = time.time() - self.retention_secs
+        for job_id in [k for k, v in self.jobs.items() if v.finished and v.finished < expired]:
+            logger.debug(f"removing expired job {job_id}")
+            del self.jobs[job_id]
@@ -0,0 +1,136 @@
+import dataclasses
+import threading
+import time
+from typing import Callable, Annotated
+
+from loguru import logger
+
+
+@dataclasses.dataclass(frozen=True)
+class ProgressEvent:
+    """Progress and throughput of an extractor while processing dates"""
+
+    extractor: str
+    days_done: int
+    days_total: int
+    days_cached: int
+    days_fetched: int
+    bytes_fetched: int
+    elapsed: Annotated[float, "seconds since extractor started"]
+    overall_done: Annotated[int, "days done by all extractors"]
+    overall_total: int
+
+    @property
+    def progress(self) -> float:
+        return self.days_done / self.days_total if self.days_total else 1.0
+
+    @property
+    def overall_progress(self) -> float:
+        return self.overall_done / self.overall_total if self.overall_total else 1.0
+
+    @property
+    def days_per_sec(self) -> float:
+        return self.days_done / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def eta(self) -> Annotated[float | None, "seconds remaining for the extractor"]:
+        rate = self.days_per_sec
+        return (self.days_total - self.days_done) / rate if rate else None
+
+    def asdict(self) -> dict:
+        return {
+            **dataclasses.asdict(self),
+            "progress": round(self.progress, 3),
+            "days_per_sec": round(self.days_per_sec, 2),
+            "eta": None if self.eta is None else round(self.eta, 1),
+        }
+
+    def __format__(self, format_spec):
+        eta = "-" if self.eta is None else f"{self.eta:.0f}s"
+        return (
+            f"{self.extractor} {self.days_done}/{self.days_total} days "
+            f"({self.days_cached} cached, {self.days_fetched} fetched, {self.bytes_fetched} bytes) "
+            f"{self.days_per_sec:.1f} days/s ETA {eta}"
+        )
+
+
+Subscriber = Callable[[ProgressEvent], None]
+
+
+class ProgressTracker:
+    """Tracks days processed per extractor and publishes a ProgressEvent to subscribers for each day.
+    Subscribers added by subscribe_all() receive events of every tracker e.g. logs, while the latest()
+    event of each extractor is kept for e.g. the REST-api.
+
+    Example:
+        tracker = ProgressTracker({"GarminExtract": 10}, subscribers=[progress_bar.on_progress])
+        tracker.advance("GarminExtract", cached=False, bytes_fetched=1024)
+    """
+
+    _global_subscribers: list[Subscriber] = []
+    _latest: dict[Annotated[str, "extractor"], ProgressEvent] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, days_total: dict[Annotated[str, "extractor"], int], subscribers: list[Subscriber] = ()):
+        self.days_total = days_total
+        self.subscribers = list(subscribers)
+        self._counts = {_: {"done": 0, "cached": 0, "fetched": 0, "bytes": 0} for _ in days_total}
+        self._started: dict[str, float] = {}
+        self._last = time.monotonic()  # extractors run in turn, each starting as the previous day is done
+
+    @classmethod
+    def subscribe_all(cls, subscriber: Subscriber) -> None:
+        with cls._lock:
+            cls._global_subscribers.append(subscriber)
+
+    @classmethod
+    def unsubscribe_all(cls, subscriber: Subscriber) -> None:
+        with cls._lock:
+            cls._global_subscribers.remove(subscriber)
+
+    @classmethod
+    def latest(cls) -> dict[str, ProgressEvent]:
+        """Most recent event of each extractor"""
+        with cls._lock:
+            return dict(cls._latest)
+
+    def advance(self, extractor: str, cached: bool, bytes_fetched: int = 0) -> ProgressEvent:
+        """Record a day processed by extractor, either served from its cache or fetched from the service"""
+        now = time.monotonic()
+        started = self._started.setdefault(extractor, self._last)
+        self._last = now
+        counts = self._counts[extractor]
+        counts["done"] += 1
+        counts["cached" if cached else "fetched"] += 1
+        counts["bytes"] += bytes_fetched
+        event = ProgressEvent(
+            extractor=extractor,
+            days_done=counts["done"],
+            days_total=self.days_total[extractor],
+            days_cached=counts["cached"],
+            days_fetched=counts["fetched"],
+            bytes_fetched=counts["bytes"],
+            elapsed=now - started,
+            overall_done=sum(_["done"] for _ in self._counts.values()),
+            overall_total=sum(self.days_total.values()),
+        )
+        self._publish(event)
+        return event
+
+    def _publish(self, event: ProgressEvent) -> None:
+        with self._lock:
+            self._latest[event.extractor] = event
+            subscribers = [*self._global_subscribers, *self.subscribers]
+        for subscriber in subscribers:
+            try:
+                subscriber(event)
+            except Exception as e:
+                logger.error(f"error publishing progress to {subscriber}: {e}")
+
+
+def log_progress(event: ProgressEvent) -> None:
+    """Subscriber logging progress along with throughput"""
+    logger.info(f"processing {event}")
+
+
+ProgressTracker.subscribe_all(log_progress)
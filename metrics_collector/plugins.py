@@ -0,0 +1,47 @@
+"""Registry of modules declaring extract, transform and load classes, imported once the orchestrator first
+needs them rather than as the package is imported. Other packages may add theirs by the entry point group
+`metrics_collector.plugins`, e.g. within their setup.py
+
+    entry_points={"metrics_collector.plugins": ["my_service = my_package.my_service"]}
+"""
+import threading
+from importlib import import_module
+from importlib.metadata import entry_points
+
+from loguru import logger
+
+builtin_plugins = (
+    "metrics_collector.extract.apple",
+    "metrics_collector.extract.garmin",
+    "metrics_collector.transform.transformers",
+    "metrics_collector.load.graph",
+)
+entry_point_group = "metrics_collector.plugins"
+
+_loaded = False
+_loading = False
+_lock = threading.RLock()
+
+
+def load_plugins() -> None:
+    """Import builtin and entry point plugins once, their classes register their dag as being declared"""
+    global _loaded, _loading
+    if _loaded:
+        return
+    with _lock:
+        if _loaded or _loading:  # loading within this thread, e.g. a plugin using the orchestrator as imported
+            return
+        _loading = True
+        try:
+            for module_name in builtin_plugins:
+                import_module(module_name)
+            for entry_point in entry_points(group=entry_point_group):
+                try:
+                    entry_point.load()
+                except Exception as e:
+                    logger.error(f"unable to load plugin {entry_point.name} ({entry_point.value}): {e}")
+                else:
+                    logger.debug(f"loaded plugin {entry_point.name}")
+            _loaded = True
+        finally:
+            _loading = False
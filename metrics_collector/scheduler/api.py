@@ -1,14 +1,34 @@
 from __future__ import annotations
+import copy
 import dataclasses
+import gzip
+import hashlib
+import itertools
 import json
+import os
+import shutil
+import time
 import tempfile
 import uuid
 from abc import ABC, abstractmethod
 from enum import Enum
 from pathlib import Path
-from typing import Optional, List, Dict, Tuple, Annotated, Protocol, Type
-
-import apprise
+from typing import Optional, List, Dict, Tuple, Annotated, Protocol, Type, ClassVar
+
+import threading
+from collections import Counter, defaultdict
+
+from apscheduler.events import (
+    EVENT_JOB_ADDED,
+    EVENT_JOB_MODIFIED,
+    EVENT_JOB_SUBMITTED,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_ERROR,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_MAX_INSTANCES,
+    JobEvent,
+    JobSubmissionEvent,
+)
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import asyncio
 from asyncio.events import AbstractEventLoop
@@ -19,8 +39,11 @@ from loguru import logger
 # Used to overcome "found in sys.modules after import of package .."
 from metrics_collector.exceptions import MetricsBaseException
 from metrics_collector.helper import import_item
-from metrics_collector.orchestrator.generic import Orchestrator
-from metrics_collector.utils import shorten, get_data_dir
+from metrics_collector.orchestrator.generic import Orchestrator, SingleFlight
+from metrics_collector.scheduler.tasks import default_executors, default_job_defaults, max_instances_per_dag
+from metrics_collector.scheduler.triggers import OffsetCronTrigger
+from metrics_collector.storage.cache import Cache
+from metrics_collector.utils import shorten, get_data_dir, normalize_period, to_date, write_atomic
 
 if not sys.warnoptions:  # allow overriding with `-W` option
     warnings.filterwarnings("ignore", category=RuntimeWarning, module="runpy")
@@ -29,6 +52,7 @@ if not sys.warnoptions:  # allow overriding with `-W` option
 class ActionType(str, Enum):
     Email = "Email"
     Cache = "Cache"
+    Snapshot = "Snapshot"
 
 
 @dataclasses.dataclass
@@ -52,13 +76,19 @@ class ScheduleParams(BaseScheduleParams):
     day_of_week: int | str
     hour: int | str
     minute: int | str
+    jitter: Annotated[int | None, "delay each run randomly by up to seconds"] = None
 
     def __format__(self, format_spec):
-        return f"Y:{self.year} M:{self.month} D:{self.day} DoW: {self.day_of_week} H:{self.hour} M:{self.minute}"
+        jitter = f" ±{self.jitter}s" if self.jitter else ""
+        return f"Y:{self.year} M:{self.month} D:{self.day} DoW: {self.day_of_week} H:{self.hour} M:{self.minute}{jitter}"
 
     def asdict(self):
         return dataclasses.asdict(self)
 
+    def cron_key(self) -> str:
+        """Schedules having the same key are due at the same time"""
+        return json.dumps({k: v for k, v in self.asdict().items() if k != "jitter"}, sort_keys=True, default=str)
+
 
 @dataclasses.dataclass
 class ScheduleConfig:
@@ -91,15 +121,32 @@ class ScheduleConfig:
 class BaseAction(ABC):
     """Used for scheduling report to e.g. know whether to email to cache, add required fields to abstract classes"""
 
+    executor: ClassVar[Annotated[str, "scheduler executor such as io or render"]] = "io"
+    graph_format: ClassVar[Annotated[str, "format of graphs used by run"]] = "png"
+    shared_graphs_ttl: ClassVar[int] = int(os.getenv("SCHEDULER_SHARED_GRAPHS_TTL", 300))
+
     def __repr__(self):
         return str(self.__dict__)
 
-    @staticmethod
+    @classmethod
     def get_graphs(
+        cls,
         c: ScheduleConfig,
         format_: Annotated[str, "Type such as `html` or `png`"] = "png",
     ) -> list:
-        """Used by concrete Action classes when run"""
+        """Used by concrete Action classes when run, graphs are computed once and shared
+        for a short while by actions due for the same dag, period and format"""
+        key = shared_graphs_key(c, format_)
+        cache = Cache.get_instance("schedule_graphs")
+        if (graphs := cache.get(key, None)) is not None:
+            logger.debug(f"using graphs shared by {key}")
+            return graphs
+        return SingleFlight.do(key, cls._compute_graphs, c, format_, key, cache)
+
+    @classmethod
+    def _compute_graphs(cls, c: ScheduleConfig, format_: str, key: str, cache: Cache) -> list:
+        if (graphs := cache.get(key, None)) is not None:  # computed while waiting to be leader
+            return graphs
         output_graphs = []
         o = Orchestrator()
         dag_name, from_, to_ = (c.dag_name, c.from_, c.to_)
@@ -111,6 +158,7 @@ class BaseAction(ABC):
             from_, to_, dag_name, transform_object, format_
         ):
             output_graphs.append(graph_data)
+        cache.set(key, output_graphs, ttl=cls.shared_graphs_ttl)
         return output_graphs
 
     @abstractmethod
@@ -130,6 +178,8 @@ class EmailAction(BaseAction):
     More details found here https://github.com/caronc/apprise/wiki/Notify_email
     """
 
+    executor: ClassVar[str] = "render"
+
     to_email: str
     subject: str
     body: str
@@ -141,8 +191,9 @@ class EmailAction(BaseAction):
         return f"{s(self.to_email)}, {s(self.subject)}"
 
     def run(self, schedule_config: ScheduleConfig):
-        ext = "png"
+        ext = self.graph_format
         graphs = self.get_graphs(schedule_config, ext)
+        import apprise  # heavy, imported once first used
         send_obj = apprise.Apprise()
         try:
             user, domain = self.mail_server_user.split("@")
@@ -175,18 +226,176 @@ class EmailAction(BaseAction):
 class CacheAction(BaseAction):
     """Main purpose for purely running and do not use graphs for caching purposes"""
 
+    executor: ClassVar[str] = "render"
+
     def __format__(self, format_spec):
         return ""
 
     def run(self, schedule_config: ScheduleConfig):
         logger.info(f"Execute caching of {schedule_config}")
-        self.get_graphs(schedule_config, "png")
+        self.get_graphs(schedule_config, self.graph_format)
 
     @classmethod
     def action_type(cls) -> ActionType:
         return ActionType.Cache
 
 
+@dataclasses.dataclass
+class SnapshotAction(BaseAction):
+    """Render all graphs of the period into static html and json files served by /static/snapshots,
+    each run into a new version directory and latest.json/index.html replaced to point to it.
+    Example: /static/snapshots/garmin_and_apple/last_90_days/
+    """
+
+    executor: ClassVar[str] = "render"
+    graph_format: ClassVar[str] = "json"  # plotted by the pages using plotly.js of /static, no CDN required
+
+    name: Annotated[str, "such as last_90_days"]
+    keep: Annotated[int, "versions kept"] = 3
+
+    def __format__(self, format_spec):
+        return f"{self.name}"
+
+    def run(self, schedule_config: ScheduleConfig):
+        dag_name = schedule_config.dag_name
+        graph_names = Orchestrator().get_graph_names(dag_name)
+        graphs = self.get_graphs(schedule_config, self.graph_format)
+        from_, to_ = (to_date(_) for _ in normalize_period(schedule_config.from_, schedule_config.to_))
+        target = get_snapshot_dir() / dag_name / self.name
+        target.mkdir(parents=True, exist_ok=True)
+        content_hash = hashlib.sha1(b"".join(_.encode() for _ in graphs)).hexdigest()[:8]
+        version = f"{time.strftime('%Y%m%d%H%M%S')}-{content_hash}"
+
+        temp = Path(tempfile.mkdtemp(prefix=f".{version}.", dir=target))
+        for graph_name, json_ in zip(graph_names, graphs):
+            for file_name, content in (
+                (f"{graph_name}.html", snapshot_graph_html.format(title=graph_name, graph=json.dumps(f"{graph_name}.json"))),
+                (f"{graph_name}.json", json_),
+            ):
+                (temp / file_name).write_text(content)
+                (temp / f"{file_name}.gz").write_bytes(gzip.compress(content.encode()))  # served precompressed
+        (temp / "index.html").write_text(
+            snapshot_index_html.format(title=f"{dag_name} {from_} - {to_}", graphs=json.dumps(graph_names))
+        )
+        temp.chmod(0o755)
+        temp.rename(target / version)  # version complete before being referred to
+
+        manifest = {"dag_name": dag_name, "from": f"{from_}", "to": f"{to_}", "version": version, "graphs": graph_names}
+        write_atomic(target / "latest.json", json.dumps(manifest))
+        write_atomic(target / "index.html", snapshot_redirect_html.format(version=version))
+        logger.info(f"Snapshot {version} of {dag_name} written to {target}")
+        self.remove_old_versions(target)
+
+    def remove_old_versions(self, target: Path):
+        versions = sorted((_ for _ in target.iterdir() if _.is_dir() and not _.name.startswith(".")), reverse=True)
+        for old in versions[self.keep:]:
+            logger.debug(f"Removing snapshot {old}")
+            shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def action_type(cls) -> ActionType:
+        return ActionType.Snapshot
+
+
+def get_snapshot_dir() -> Path:
+    """Directory of snapshots served at /static/snapshots, within the data dir unless env SNAPSHOT_DIR"""
+    return Path(os.getenv("SNAPSHOT_DIR", Path(get_data_dir()) / "snapshots"))
+
+
+snapshot_graph_html = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="utf-8">
+    <title>{title}</title>
+    <script src="/static/plotly.min.js"></script>
+</head>
+<body>
+    <div id="graph"></div>
+    <script>
+        fetch({graph}).then(r => r.json()).then(f => Plotly.newPlot('graph', f.data, f.layout, {{responsive: true}}));
+    </script>
+</body>
+</html>
+"""
+
+snapshot_index_html = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="utf-8">
+    <title>{title}</title>
+    <script src="/static/plotly.min.js"></script>
+</head>
+<body style="background: black;">
+    <div id="graphs"></div>
+    <script>
+        for (const graph of {graphs}) {{
+            const div = document.createElement('div');
+            document.getElementById('graphs').appendChild(div);
+            fetch(`${{graph}}.json`).then(r => r.json()).then(f => Plotly.newPlot(div, f.data, f.layout, {{responsive: true}}));
+        }}
+    </script>
+</body>
+</html>
+"""
+
+snapshot_redirect_html = """<!DOCTYPE html>
+<html lang="en">
+<head><meta http-equiv="refresh" content="0; url={version}/"></head>
+<body><a href="{version}/">{version}</a></body>
+</html>
+"""
+
+
+def run_actions(*schedule_configs: ScheduleConfig):
+    """Run actions of schedules due together, referable by module to allow running within a process pool.
+    Graphs computed by the first are shared with the rest, a failing action does not stop the others"""
+    failed = []
+    for schedule_config in schedule_configs:
+        try:
+            schedule_config.action_data.run(schedule_config)
+        except Exception as e:
+            logger.error(f"{schedule_config.action_type} of {schedule_config.dag_name} failed: {e}")
+            failed.append(e)
+    if failed:
+        raise failed[0]
+
+
+def shared_graphs_key(schedule_config: ScheduleConfig, format_: str) -> str:
+    from_, to_ = (to_date(_) for _ in normalize_period(schedule_config.from_, schedule_config.to_))
+    return f"{schedule_config.dag_name}:{from_}:{to_}:{format_}"
+
+
+def get_spread_offsets(
+    jobs: dict[Annotated[str, "job id"], tuple[ScheduleConfig, ...]], window_secs: int
+) -> dict[Annotated[str, "job id"], int]:
+    """Offset of jobs due at the same time and extracting from the same service, evenly spread across window"""
+    if not window_secs:
+        return {}
+    o = Orchestrator()
+    same_time_and_service = defaultdict(list)
+    for job_id, group in sorted(jobs.items()):
+        schedule_params = group[0].schedule_params
+        services = {_.__name__ for c in group for _ in o.get_dag_plan(c.dag_name).extract_classes}
+        for service in services:
+            same_time_and_service[(schedule_params.cron_key(), service)].append(job_id)
+    offsets = {}
+    for job_ids in same_time_and_service.values():
+        for i, job_id in enumerate(job_ids):
+            offsets[job_id] = max(offsets.get(job_id, 0), i * window_secs // len(job_ids))
+    return offsets
+
+
+def schedule_group_key(schedule_config: ScheduleConfig) -> tuple:
+    """Schedules due at the same time (whatever their jitter) computing the same graphs, by the period as configured
+    so that relative periods such as "7 days ago" keep their group (and job) across days"""
+    c, action = schedule_config, schedule_config.action_data
+    return (
+        c.schedule_params.cron_key(),
+        f"{c.dag_name}:{c.from_}:{c.to_}:{action.graph_format}",
+        action.executor,
+    )
+
+
 class MyScheduler:
     _instance = None
 
@@ -195,10 +404,32 @@ class MyScheduler:
         initials: List[Tuple[str, str, Dict]] | None = None,
         schedule_queue: Optional[asyncio.Queue] = None,
         loop: AbstractEventLoop = None,
+        executors: dict | None = None,
+        job_defaults: dict | None = None,
+        spread_secs: Annotated[int | None, "window staggering jobs sharing a service, 0 to disable"] = None,
     ) -> None:
         self.reload_id = "reload_on_config_update"
         self.loop = loop
-        self.scheduler = AsyncIOScheduler()
+        self.spread_secs = spread_secs if spread_secs is not None else int(os.getenv("SCHEDULER_SPREAD_SECS", 300))
+        self.scheduler = AsyncIOScheduler(
+            executors=copy.deepcopy(executors or default_executors),  # consumed by apscheduler
+            job_defaults=copy.deepcopy(job_defaults or default_job_defaults),
+        )
+        self.metrics: Counter = Counter()
+        self.queue_depth: Counter[Annotated[str, "executor"]] = Counter()
+        self._job_executors: dict[Annotated[str, "job id"], str] = {}
+        self._job_runs: Counter[Annotated[str, "job id"]] = Counter()
+        self._metrics_lock = threading.Lock()  # events are dispatched from executor threads
+        self.scheduler.add_listener(
+            self._on_job_event,
+            EVENT_JOB_ADDED
+            | EVENT_JOB_MODIFIED
+            | EVENT_JOB_SUBMITTED
+            | EVENT_JOB_EXECUTED
+            | EVENT_JOB_ERROR
+            | EVENT_JOB_MISSED
+            | EVENT_JOB_MAX_INSTANCES,
+        )
 
         if schedule_queue is None:
             self.queue = schedule_queue
@@ -207,6 +438,7 @@ class MyScheduler:
         self.initials = initials
         if initials:
             self.add_initials(self.initials)
+        self.config_signature = scheduler_config_signature()
         self.current_config = load_scheduler_config()
         self.refresh_scheduled_jobs()
         self._running = None
@@ -246,6 +478,35 @@ class MyScheduler:
     async def start_async(self):
         self.scheduler.start()
 
+    def _on_job_event(self, event: JobEvent | JobSubmissionEvent):
+        """Keep count of runs submitted to each executor and not yet finished"""
+        with self._metrics_lock:
+            if event.code in (EVENT_JOB_ADDED, EVENT_JOB_MODIFIED):
+                if job := self.scheduler.get_job(event.job_id):
+                    self._job_executors[event.job_id] = job.executor
+            elif event.code == EVENT_JOB_SUBMITTED:
+                runs = len(event.scheduled_run_times)  # each run time reported once done
+                self.queue_depth[self._job_executors.get(event.job_id, "default")] += runs
+                self._job_runs[event.job_id] += runs
+                self.metrics["submitted"] += 1
+            elif event.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR):
+                self.queue_depth[self._job_executors.get(event.job_id, "default")] -= 1
+                self._job_runs[event.job_id] -= 1
+                if self._job_runs[event.job_id] <= 0 and not self.scheduler.get_job(event.job_id):
+                    self._job_executors.pop(event.job_id, None)  # e.g. date triggered jobs being done
+                    del self._job_runs[event.job_id]
+                self.metrics["executed" if event.code == EVENT_JOB_EXECUTED else "errors"] += 1
+            elif event.code == EVENT_JOB_MISSED:
+                self.metrics["missed"] += 1
+            elif event.code == EVENT_JOB_MAX_INSTANCES:
+                logger.warning(f"skipped run of {event.job_id}, reached its max instances")
+                self.metrics["max_instances_skipped"] += 1
+
+    def get_metrics(self) -> dict:
+        """Jobs within each executor (queue depth) along with counters of runs"""
+        with self._metrics_lock:
+            return {"queue_depth": dict(self.queue_depth), **self.metrics}
+
     def add_task(self, _func, _type, _args=None, _kwargs=None, **kwargs):
         if _kwargs is None:
             _kwargs = {}
@@ -262,42 +523,70 @@ class MyScheduler:
         for _func, _type, kwargs in initials:
             self.add_task(_func, _type, **kwargs)
 
-    def remove_current_scheduled(self):
-        logger.debug(f"Removing existing jobs")
-        for job in self.scheduler.get_jobs():
-            if job.id == self.reload_id:
-                continue
-            job.remove()
+    def get_schedule_job_ids(self) -> set[str]:
+        return {_.id for _ in self.scheduler.get_jobs() if _.id.startswith(schedule_job_prefix)}
+
+    @staticmethod
+    def get_trigger(group: tuple[ScheduleConfig, ...], offset: int = 0) -> OffsetCronTrigger:
+        """One trigger for schedules due together, delayed by the largest jitter among them"""
+        jitter = max((_.schedule_params.jitter for _ in group if _.schedule_params.jitter), default=None)
+        return OffsetCronTrigger(offset=offset, **group[0].schedule_params.asdict() | {"jitter": jitter})
 
     def refresh_scheduled_jobs(self, trigger_type="interval"):
-        self.remove_current_scheduled()
-        for config_params in self.current_config:
+        """Apply current config by only adding and removing jobs of schedules changed,
+        leaving unchanged jobs (and those running) undisturbed"""
+        wanted = {}
+        for group_key, group in itertools.groupby(sorted(self.current_config, key=schedule_group_key), key=schedule_group_key):
+            wanted[schedule_job_id(group_key)] = tuple(sorted(group, key=schedule_content))
+        existing = self.get_schedule_job_ids()
+        offsets = get_spread_offsets(wanted, self.spread_secs)
+        for job_id in existing - wanted.keys():
+            logger.debug(f"Removing schedule {job_id}")
+            self.scheduler.remove_job(job_id)
+        for job_id in wanted.keys() - existing:
+            group = wanted[job_id]
+            config_params = group[0]
             okay, error_msg = self.verify_job(config_params.schedule_params)
             if not okay:
                 logger.warning(f"Schedule {config_params} bad due to {error_msg}")
                 continue
-            ...
             logger.debug(
-                f"Adding schedule for {config_params.action_type} on {config_params.schedule_params}"
+                f"Adding schedule for {', '.join(_.action_type for _ in group)} on {config_params.schedule_params}"
             )
             self.add_task(
-                config_params.action_data.run,
-                "cron",
-                (config_params,),
-                **config_params.schedule_params.asdict(),
+                run_actions,
+                self.get_trigger(group, offsets.get(job_id, 0)),
+                group,
+                id=job_id,
+                executor=config_params.action_data.executor,
+                max_instances=max_instances_per_dag.get(
+                    config_params.dag_name, default_job_defaults["max_instances"]
+                ),
             )
-            ...
+        for job_id in wanted.keys() & existing:
+            job = self.scheduler.get_job(job_id)
+            if tuple(job.args) != wanted[job_id]:  # an instance running keeps its schedules
+                logger.debug(f"Updating schedules of {job_id}")
+                self.scheduler.modify_job(job_id, args=wanted[job_id])
+            trigger = self.get_trigger(wanted[job_id], offsets.get(job_id, 0))
+            if (getattr(job.trigger, "offset", 0), getattr(job.trigger, "jitter", None)) != (trigger.offset, trigger.jitter):
+                logger.debug(f"Respreading schedule {job_id} by {trigger.offset}s ±{trigger.jitter or 0}s")
+                self.scheduler.reschedule_job(job_id, trigger=trigger)
         # TODO: call method of ActionType to get method to be scheduled
 
     def stop(self):
         self._running = False
 
     async def reload_on_config_update(self):
+        """Reload config only when its file been modified"""
+        if (signature := scheduler_config_signature()) == self.config_signature:
+            return
+        self.config_signature = signature
         new_config = load_scheduler_config()
         if not new_config == self.current_config:
             logger.info("detected new config and reloading")
+            self.current_config = new_config
             self.refresh_scheduled_jobs()
-        self.current_config = new_config
 
 
 def scheduler_config_file() -> Path:
@@ -308,6 +597,24 @@ def scheduler_config_file() -> Path:
     return f
 
 
+def scheduler_config_signature() -> tuple[int, int]:
+    """Modified time and size of the config, cheap to compare for detecting changes"""
+    stat = scheduler_config_file().stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+schedule_job_prefix = "schedule-"
+
+
+def schedule_job_id(group_key: tuple) -> str:
+    """Job id of the schedules sharing group_key, kept across reloads while its schedules are edited"""
+    return f"{schedule_job_prefix}{hashlib.sha1(json.dumps(group_key).encode()).hexdigest()[:16]}"
+
+
+def schedule_content(schedule_config: ScheduleConfig) -> str:
+    return json.dumps(dataclasses.asdict(schedule_config), sort_keys=True, default=str)
+
+
 def get_scheduler_config() -> list[dict]:
     f = scheduler_config_file()
     if f.exists():
@@ -1,15 +1,74 @@
+import asyncio
+import itertools
+import os
 from datetime import datetime
 from loguru import logger
 
+from metrics_collector.orchestrator.generic import Orchestrator
+from metrics_collector.storage.usage import UsageTracker
+
 default_initial_scheduled_tasks = [
     [
         "metrics_collector.scheduler.tasks.ping",
         "interval",
         {"seconds": 3600, "id": "tick"},
     ],
+    [
+        "metrics_collector.scheduler.tasks.warm_popular",
+        "cron",
+        {  # shortly after new data of the day is expected by the services
+            "hour": int(os.getenv("WARM_HOUR", 5)),
+            "minute": int(os.getenv("WARM_MINUTE", 30)),
+            "id": "warm_popular",
+        },
+    ],
 ]
 
+# actions run by executor of their type, coroutines such as ping within the event loop
+default_executors = {
+    "default": {"type": "asyncio"},
+    "io": {"type": "threadpool", "max_workers": int(os.getenv("SCHEDULER_IO_WORKERS", 2))},
+    "render": {
+        "type": os.getenv("SCHEDULER_RENDER_EXECUTOR", "processpool"),
+        "max_workers": int(os.getenv("SCHEDULER_RENDER_WORKERS", 2)),
+    },
+}
+
+default_job_defaults = {
+    "coalesce": True,  # run missed runs once rather than all of them
+    "max_instances": 1,
+    "misfire_grace_time": 300,
+}
+
+max_instances_per_dag: dict[str, int] = {}  # e.g. {"garmin_and_apple": 2}, otherwise default_job_defaults
+
 
 async def ping():
     print("ping")
     logger.debug("Pong! The time is: %s" % datetime.now())
+
+
+async def warm_popular(top_n: int | None = None):
+    """Pre-extract and pre-render the top_n (env WARM_TOP_N or 10) most requested graphs, relative periods being those of today"""
+    top_n = top_n or int(os.getenv("WARM_TOP_N", 10))
+    o = Orchestrator()
+    popular = [key for key, _ in UsageTracker.get_popular(top_n)]
+    by_period = lambda _: (_.dag_name, _.get_period())
+    for (dag_name, (from_, to_)), keys in itertools.groupby(sorted(popular, key=by_period), key=by_period):
+        keys = list(keys)
+        logger.info(f"warming {len(keys)} graphs of {dag_name} for {from_} to {to_}")
+        try:
+            extract_objects = o.get_extract_objects(dag_name, o.get_stored_params(dag_name))
+            await o.aprocess_dates(extract_objects, from_, to_)
+            transform_object = await o.aget_transform_object(dag_name, extract_objects)
+        except Exception as e:
+            logger.warning(f"unable to warm {dag_name} for {from_} to {to_}: {e}")
+            continue
+        pipeline_graphs = tuple({_.graph_name for _ in keys})  # processed once for all graphs of the period
+        results = await asyncio.gather(
+            *(o.aget_graph(_.graph_name, from_, to_, dag_name, transform_object, _.format_, pipeline_graphs) for _ in keys),
+            return_exceptions=True,
+        )
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                logger.warning(f"unable to warm {key}: {result}")
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from apscheduler.triggers.cron import CronTrigger
+
+
+class OffsetCronTrigger(CronTrigger):
+    """Cron trigger firing offset seconds after each cron time, used for staggering jobs otherwise due at the same time
+
+    Example:
+        OffsetCronTrigger(offset=90, hour=7, minute=0)  # fires 07:01:30 every day
+    """
+
+    def __init__(self, offset: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.offset = offset
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        delta = timedelta(seconds=self.offset)
+        previous_fire_time = previous_fire_time - delta if previous_fire_time else None
+        next_fire_time = super().get_next_fire_time(previous_fire_time, now - delta)
+        return next_fire_time + delta if next_fire_time else None
+
+    def __getstate__(self):
+        return {**super().__getstate__(), "offset": self.offset}
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.offset = state.get("offset", 0)
+
+    def __str__(self):
+        return f"{super().__str__()} +{self.offset}s"
+
+    def __repr__(self):
+        return f"{super().__repr__()[:-1]}, offset={self.offset}>"
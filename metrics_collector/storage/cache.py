@@ -0,0 +1,242 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Annotated, Any
+
+from loguru import logger
+
+from metrics_collector.utils import get_data_dir
+
+_missing = object()
+_pickle_header = b"\x80"  # pickle protocol 2+ while zlib streams never start with it, telling uncompressed values apart
+
+
+class Cache:
+    """Bounded key/value cache, an in-memory LRU (L1) in front of SQLite in WAL mode (L2).
+    Readers run concurrently, writes are atomic transactions serialized by a single writer.
+    Values are returned as stored in L1 rather than copied, so treat them as immutable (copy before modifying).
+
+    Example:
+        cache = Cache.get_instance("graph_cache")
+        cache.set("key", "<div>graph</div>", ttl=3600)
+        cache.get("key")  # "<div>graph</div>"
+        cache.stats()  # {"hits": 1, "l1_hits": 1, "misses": 0, ...}
+    """
+
+    _instances: dict[str, "Cache"] = {}
+    _instances_lock = threading.Lock()
+    legacy_suffixes = ("", ".db", ".dat", ".dir", ".bak")  # shelve files used before, by dbm module
+    flush_accessed_every = 64  # disk hits recorded in batches rather than a write each
+    flush_accessed_secs = 5
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: Annotated[int | None, "defaults to env CACHE_MAX_ENTRIES or 5000"] = None,
+        max_bytes: Annotated[int | None, "defaults to env CACHE_MAX_MB or 256 MB"] = None,
+        ttl: Annotated[float | None, "default seconds until expired, None for never"] = None,
+        l1_entries: int = 64,
+    ):
+        self.path = path
+        self.max_entries = max_entries or int(os.getenv("CACHE_MAX_ENTRIES", 5000))
+        self.max_bytes = max_bytes or int(os.getenv("CACHE_MAX_MB", 256)) * 1024 ** 2
+        self.ttl = ttl
+        self.l1_entries = l1_entries
+        self._l1: OrderedDict[str, tuple[Any, float | None]] = OrderedDict()
+        self._l1_lock = threading.Lock()
+        self._write_lock = threading.Lock()  # single writer, readers are not blocked in WAL mode
+        self._local = threading.local()  # sqlite connections can not be shared between threads
+        self._accessed: dict[str, float] = {}  # disk hits not yet written
+        self._accessed_flushed = time.time()
+        self.counters = {"hits": 0, "l1_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._counters_lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self._write_lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, accessed REAL, expires REAL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path}, {self.counters})"
+
+    @classmethod
+    def get_instance(cls, name: str, **kwargs) -> "Cache":
+        """Shared cache stored as name within the data dir"""
+        path = f"{get_data_dir()}/{name}.sqlite"
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._remove_legacy(Path(path).with_suffix(""))
+                cls._instances[path] = cls(path, **kwargs)
+        return cls._instances[path]
+
+    @classmethod
+    def _remove_legacy(cls, path: Path):
+        """Remove shelve files of the same name, replaced by this cache"""
+        for legacy in (path.with_name(f"{path.name}{_}") for _ in cls.legacy_suffixes):
+            if legacy.is_file():
+                logger.info(f"removing legacy cache {legacy}")
+                legacy.unlink(missing_ok=True)
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():  # not shared with forked processes either
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def _count(self, *names: str, n: int = 1):
+        with self._counters_lock:
+            for name in names:
+                self.counters[name] += n
+
+    def _get_l1(self, key: str):
+        with self._l1_lock:
+            if key not in self._l1:
+                return _missing
+            value, expires = self._l1[key]
+            if expires is not None and expires < time.time():
+                del self._l1[key]
+                return _missing
+            self._l1.move_to_end(key)
+            return value
+
+    def _set_l1(self, key: str, value, expires: float | None):
+        with self._l1_lock:
+            self._l1[key] = (value, expires)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_entries:
+                self._l1.popitem(last=False)
+
+    def get(self, key: str, default=None):
+        """Cached value of key, default if missing or expired"""
+        if (value := self._get_l1(key)) is not _missing:
+            self._count("hits", "l1_hits")
+            return value
+        now = time.time()
+        try:
+            row = self._connection.execute(
+                "SELECT value, expires FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (key, now),
+            ).fetchone()
+        except sqlite3.DatabaseError as e:
+            logger.warning(f"unable to read cache {self.path}: {e}")
+            row = None
+        if row is None:
+            self._count("misses")
+            return default
+        self._count("hits")
+        blob = row[0]
+        value = pickle.loads(blob if blob[:1] == _pickle_header else zlib.decompress(blob))
+        self._set_l1(key, value, row[1])
+        with self._l1_lock:  # keeps the least recently used order, hits within L1 are not recorded
+            self._accessed[key] = now
+            flush = len(self._accessed) >= self.flush_accessed_every or now - self._accessed_flushed > self.flush_accessed_secs
+        if flush:
+            with self._write_lock:
+                self._flush_accessed(self._connection)
+        return value
+
+    def _flush_accessed(self, connection: sqlite3.Connection):
+        """Write access times of disk hits, within the write lock"""
+        with self._l1_lock:
+            accessed, self._accessed = self._accessed, {}
+            self._accessed_flushed = time.time()
+        if accessed:
+            connection.executemany("UPDATE cache SET accessed = ? WHERE key = ?", [(t, k) for k, t in accessed.items()])
+
+    def set(self, key: str, value, ttl: float | None = _missing, compress: bool = True) -> int:
+        """Store value for key, expired after ttl seconds (defaults to the ttl of the cache), returns stored bytes.
+        Use compress=False for values already compressed, e.g. encoded responses"""
+        ttl = self.ttl if ttl is _missing else ttl
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        compressed = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if compress:
+            compressed = zlib.compress(compressed)
+        with self._write_lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, size, accessed, expires) VALUES (?, ?, ?, ?, ?)",
+                    (key, compressed, len(compressed), now, expires),
+                )
+                self._flush_accessed(connection)  # before evicting by least recently used
+                self._evict(connection, now)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        self._count("writes")
+        self._set_l1(key, value, expires)
+        return len(compressed)
+
+    def _evict(self, connection: sqlite3.Connection, now: float):
+        """Remove expired entries followed by least recently used until within limits"""
+        evicted = connection.execute("DELETE FROM cache WHERE expires <= ?", (now,)).rowcount
+        count, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        if count > self.max_entries or size > self.max_bytes:
+            rows = connection.execute("SELECT key, size FROM cache ORDER BY accessed").fetchall()
+            remove = []
+            for key, entry_size in rows[:-1]:  # always keep the most recent
+                if count <= self.max_entries and size <= self.max_bytes:
+                    break
+                remove.append((key,))
+                count, size = count - 1, size - entry_size
+            connection.executemany("DELETE FROM cache WHERE key = ?", remove)
+            with self._l1_lock:
+                for (key,) in remove:
+                    self._l1.pop(key, None)
+            evicted += len(remove)
+        if evicted:
+            logger.debug(f"evicted {evicted} entries from {self.path}")
+            self._count("evictions", n=evicted)
+
+    def items(self, prefix: str = "") -> list[tuple[str, Any]]:
+        """Unexpired keys starting with prefix and their values, neither counted nor marked as accessed"""
+        rows = self._connection.execute(
+            "SELECT key, value FROM cache WHERE substr(key, 1, ?) = ? AND (expires IS NULL OR expires > ?)",
+            (len(prefix), prefix, time.time()),
+        ).fetchall()
+        return [(key, pickle.loads(blob if blob[:1] == _pickle_header else zlib.decompress(blob))) for key, blob in rows]
+
+    def delete(self, key: str):
+        with self._l1_lock:
+            self._l1.pop(key, None)
+        with self._write_lock:
+            self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._l1_lock:
+            self._l1.clear()
+        with self._write_lock:
+            self._connection.execute("DELETE FROM cache")
+
+    def __len__(self):
+        return self.stats()["entries"]
+
+    def stats(self) -> dict[str, int | float]:
+        """Hit/miss counters along with current entries and size"""
+        count, size = self._connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE expires IS NULL OR expires > ?",
+            (time.time(),),
+        ).fetchone()
+        with self._counters_lock:
+            counters = dict(self.counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_ratio": round(counters["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": count,
+            "bytes": size,
+        }
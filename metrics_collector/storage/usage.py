@@ -0,0 +1,116 @@
+import datetime
+import threading
+import time
+from typing import Annotated, NamedTuple
+
+from loguru import logger
+
+from metrics_collector.storage.cache import Cache
+from metrics_collector.utils import normalize_period, to_date
+
+
+class UsageKey(NamedTuple):
+    """Graph requested for a period relative to the day requested, e.g. last 30 days is (30, 0),
+    or for a fixed period ending on the day of anchor when it didn't end the day requested or the day before"""
+
+    dag_name: str
+    from_days_ago: int
+    to_days_ago: int
+    graph_name: str
+    format_: str
+    anchor: datetime.date | None = None
+
+    def get_period(self, today: datetime.date | None = None) -> tuple[datetime.date, datetime.date]:
+        """Absolute period of today"""
+        today = self.anchor or today or datetime.date.today()
+        return today - datetime.timedelta(days=self.from_days_ago), today - datetime.timedelta(days=self.to_days_ago)
+
+    def __format__(self, format_spec):
+        if self.anchor:
+            from_, to_ = self.get_period()
+            return f"{self.dag_name} {self.graph_name}.{self.format_} from {from_} to {to_}"
+        return f"{self.dag_name} {self.graph_name}.{self.format_} last {self.from_days_ago - self.to_days_ago} days"
+
+
+class UsageTracker:
+    """Popularity of graphs requested, counts decaying by half_life_days to favour recent usage.
+    Each graph is a row of its own, those decayed below min_score or beyond max_keys are pruned.
+
+    Example:
+        UsageTracker.record("garmin_and_apple", "2022-01-01", "2022-01-31", "graph_weekly_weight", "html")
+        UsageTracker.get_popular(5)  # [(UsageKey(...), score), ...]
+    """
+
+    cache_name = "usage"
+    half_life_days = 7
+    min_score = 0.05  # a single request a month ago, forgotten when decayed below
+    max_keys = 200
+    prune_every = 100
+    _records = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def _decayed(cls, score: float, last: float, now: float) -> float:
+        return score * 0.5 ** ((now - last) / (cls.half_life_days * 86400))
+
+    @staticmethod
+    def _cache_key(key: UsageKey) -> str:
+        return f"usage:{tuple(key)}"
+
+    @classmethod
+    def record(cls, dag_name: str, from_, to_, graph_name: str, format_: str, today: datetime.date | None = None):
+        """Record a graph requested, never failing the request"""
+        try:
+            cls._record(dag_name, from_, to_, graph_name, format_, today)
+        except Exception as e:
+            logger.warning(f"unable to record usage of {dag_name} {graph_name}: {e}")
+
+    @classmethod
+    def _record(cls, dag_name, from_, to_, graph_name, format_, today=None):
+        from_, to_ = (to_date(_) for _ in normalize_period(from_, to_))
+        today = today or datetime.date.today()
+        anchor = None if (today - to_).days in (0, 1) else to_  # e.g. "last 30 days" rather than a past month
+        key = UsageKey(
+            dag_name,
+            ((anchor or today) - from_).days,
+            ((anchor or today) - to_).days,
+            getattr(graph_name, "value", graph_name),
+            getattr(format_, "value", format_),
+            anchor,
+        )
+        now = time.time()
+        cache = Cache.get_instance(cls.cache_name)
+        with cls._lock:  # one row each key, read and written within the lock
+            _, score, last = cache.get(cls._cache_key(key), None) or (key, 0.0, now)
+            cache.set(cls._cache_key(key), (key, cls._decayed(score, last, now) + 1, now))
+            cls._records += 1
+            prune = cls._records % cls.prune_every == 0
+        if prune:
+            cls.prune()
+        logger.debug(f"recorded usage of {key}")
+
+    @classmethod
+    def _get_scores(cls, now: float) -> list[tuple[UsageKey, float]]:
+        """Decayed scores, most popular first"""
+        rows = Cache.get_instance(cls.cache_name).items("usage:")
+        scores = [(key, cls._decayed(score, last, now)) for _, (key, score, last) in rows]
+        return sorted(scores, key=lambda _: _[1], reverse=True)
+
+    @classmethod
+    def prune(cls) -> int:
+        """Forget graphs decayed below min_score or beyond the max_keys most popular, returns how many"""
+        cache = Cache.get_instance(cls.cache_name)
+        with cls._lock:
+            scores = cls._get_scores(time.time())
+            forgotten = [key for i, (key, score) in enumerate(scores) if score < cls.min_score or i >= cls.max_keys]
+            for key in forgotten:
+                cache.delete(cls._cache_key(key))
+        if forgotten:
+            logger.debug(f"forgot usage of {len(forgotten)} graphs")
+        return len(forgotten)
+
+    @classmethod
+    def get_popular(cls, top_n: int = 10) -> list[tuple[UsageKey, Annotated[float, "score"]]]:
+        """Most popular graphs requested, most popular first"""
+        cls.prune()
+        return cls._get_scores(time.time())[:top_n]
@@ -1,4 +1,6 @@
 import datetime
+import threading
+from functools import wraps
 
 import pandas as pd
 import pandera as pa
@@ -8,7 +10,7 @@ from collections.abc import Iterable
 from abc import ABC, abstractmethod
 from metrics_collector.extract.base import BaseExtract
 
-from metrics_collector.orchestrator.generic import register_dag_name
+from metrics_collector.orchestrator.generic import register_dag_name, ClassType
 
 
 class TransformError(Exception):
@@ -19,14 +21,37 @@ class TransformError(Exception):
         raise exc
 
 
+def derives(*columns: str, requires: Iterable[str] = ()):
+    """Declare a pipeline step deriving columns from the required input columns.
+    The step is skipped when the pipeline runs for columns not depending on it."""
+
+    def decorator(func):
+        @wraps(func)
+        def step(self, *args, **kwargs):
+            if self.required_columns is not None and not self.required_columns.intersection(columns):
+                logger.debug(f"skipping {func.__name__}, none of {columns} required")
+                return self
+            return func(self, *args, **kwargs)
+
+        step.derived_columns = frozenset(columns)
+        step.input_columns = frozenset(requires)
+        return step
+
+    return decorator
+
+
 class BaseTransform(ABC):
     input_schema: pa.DataFrameSchema = NotImplemented
     dag_name: str | Iterable = NotImplemented
     df: pd.DataFrame = None
+    required_columns: frozenset[str] | None = None  # None meaning all columns
 
     def __init__(self, *extract_classes: list[BaseExtract]):
         """Extract classes as arguments and merges"""
-        self.df = pd.concat([getattr(_, "to_df")() for _ in extract_classes])
+        self.data_version = tuple(_.get_data_version() for _ in extract_classes)
+        self.source_df = self.merge_frames([getattr(_, "to_df")() for _ in extract_classes])
+        self.df = self.source_df.copy()
+        self._pipeline_lock = threading.Lock()
 
     @classmethod
     def __init_subclass__(cls, **kwargs):
@@ -35,14 +60,83 @@ class BaseTransform(ABC):
                 raise NotImplementedError(
                     f"Assure class variables being declared in subclass"
                 )
-        register_dag_name(cls)
+        register_dag_name(cls, ClassType.transform)
 
     def __repr__(self):
-        return f"{self.__class__.__name__}()"
+        return f"{self.__class__.__name__}({self.data_version})"  # data version keep cache keys apart
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_pipeline_lock"]  # allow passing to a process executor
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pipeline_lock = threading.Lock()
+
+    @staticmethod
+    def merge_frames(frames: Iterable[pd.DataFrame], drop_col="date") -> pd.DataFrame:
+        """Outer join extractor frames on a shared sorted DatetimeIndex.
+        Columns contributed by only one extractor are joined as is, only overlapping columns
+        are resolved by keeping the first non-null value in the order of the extractors."""
+        blocks, overlaps, seen = [], [], set()
+        for df in frames:
+            if df.empty:
+                continue
+            df = df.drop(columns=drop_col, errors="ignore")
+            df.index = pd.to_datetime(df.index)
+            if not df.index.is_unique:
+                df = df.groupby(df.index).first()
+            own = [_ for _ in df.columns if _ not in seen]
+            overlaps.extend(df[_] for _ in df.columns if _ in seen)
+            seen.update(own)
+            blocks.append(df[own])
+        if not blocks:
+            return pd.DataFrame()
+        merged = pd.concat(blocks, axis=1, join="outer").sort_index()
+        for series in overlaps:  # conflict resolution only where columns overlap
+            merged[series.name] = merged[series.name].fillna(series.reindex(merged.index))
+        return merged
 
     def __str__(self):
         return f"{self.__class__.__name__} with size {self.df.shape}"
 
+    def run_pipeline(
+        self, from_: datetime.date, to_: datetime.date, columns: Iterable[str] | None = None
+    ) -> pd.DataFrame:
+        """Validate and process a fresh copy of the merged data, deriving only what columns depend on"""
+        with self._pipeline_lock:  # pipeline steps work on self.df
+            self.df = self.source_df.copy()
+            self.require_columns(columns)
+            self.validate()
+            return self.process_pipeline(from_, to_)
+
+    def require_columns(self, columns: Iterable[str] | None):
+        """Resolve columns with the inputs of the steps deriving them, None for all columns"""
+        if columns is None:
+            self.required_columns = None
+            return self
+        required = set(columns)
+        resolved = False
+        while not resolved:
+            before = len(required)
+            for step in self.get_derived_steps():
+                if step.derived_columns & required:
+                    required |= step.derived_columns | step.input_columns
+            resolved = len(required) == before
+        logger.debug(f"pipeline limited to columns {required}")
+        self.required_columns = frozenset(required)
+        return self
+
+    @classmethod
+    def get_derived_steps(cls) -> list:
+        """Get pipeline steps declared using @derives"""
+        attributes = (getattr(cls, _) for _ in dir(cls))
+        return [_ for _ in attributes if hasattr(_, "derived_columns")]
+
+    def is_required(self, column: str) -> bool:
+        return self.required_columns is None or column in self.required_columns
+
     @abstractmethod
     def process_pipeline(
         self, from_: datetime.date, to_: datetime.date
@@ -61,12 +155,13 @@ class BaseTransform(ABC):
 
     def aggregate_combined_dataframes(self, drop_col="date"):
         """Ensure consistent columns after combining dataframes"""
-        strategy = {_: "first" for _ in self.df.columns}
-        self.df = self.df.groupby(self.df.index).agg(strategy)
-        self.df.sort_index()
+        if not self.df.index.is_unique:  # already one row per day when merged by merge_frames
+            strategy = {_: "first" for _ in self.df.columns}
+            self.df = self.df.groupby(self.df.index).agg(strategy)
+        self.df.sort_index(inplace=True)
         assert self.df.size > 0, "no data in dataframe no graphs can be made"
         if drop_col:
-            self.df.drop(drop_col, axis=1, inplace=True)
+            self.df.drop(drop_col, axis=1, inplace=True, errors="ignore")
         return self
 
     def add_missing_columns(self, columns: str | Iterable, default_value=0.0):
@@ -95,7 +190,7 @@ class BaseTransform(ABC):
         ),
     ):
         """Filling missing values use linear backward"""
-        for _ in cols:
+        for _ in filter(self.is_required, cols):
             self.df[_].replace(nan_value, np.NaN, inplace=True)
             self.df[_].interpolate(
                 method="linear", limit_direction="backward", inplace=True
@@ -3,7 +3,7 @@ import datetime
 import numpy as np
 import pandas as pd
 import pandera as pa
-from metrics_collector.transform.base import BaseTransform, TransformError
+from metrics_collector.transform.base import BaseTransform, TransformError, derives
 
 
 class GarminAppleTransform(BaseTransform):
@@ -34,6 +34,10 @@ class GarminAppleTransform(BaseTransform):
         )
         return self.df
 
+    @derives(
+        "avg_speed_running_trip",
+        requires=("running_duration_seconds", "running_distance_meters"),
+    )
     def add_col_avg_speed_running_trip(
         self, trip_distance_meters=6000, margin_percentage=8
     ):
@@ -54,6 +58,19 @@ class GarminAppleTransform(BaseTransform):
             raise TransformError(e)
         return self
 
+    @derives(
+        "running_distance_garmin",
+        "walking_distance_garmin",
+        "walking_running_distance_applehealth",
+        "walking_km",
+        "running_km",
+        "total_distance_km",
+        requires=(
+            "running_distance_meters",
+            "walking_distance_meters",
+            "distancewalkingrunning_km_sum",
+        ),
+    )
     def add_apple_garmin_distances(self):
         """Adding columns combining distances from both Garmin and Apple"""
         self.df["running_distance_garmin"] = self.df.running_distance_meters.apply(
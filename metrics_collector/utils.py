@@ -1,4 +1,5 @@
 import os
+import threading
 from datetime import datetime, timedelta, date
 from pathlib import Path
 from typing import Generator, Annotated
@@ -8,36 +9,6 @@ from loguru import logger
 from loguru._file_sink import FileSink
 from parsedatetime import Calendar
 
-from inspect import isclass
-from pkgutil import iter_modules
-from pathlib import Path
-from importlib import import_module
-import inspect
-
-
-def load_all_submodules(calling_package_name: Annotated[str | None, "send __name__ as argument"] = None):
-    """iterate through the modules in the package and load it"""
-    if calling_package_name:
-        *_, pkg_name = calling_package_name.split('.')
-        stack_frames = inspect.stack()
-        stack_frames_sum = [(f.function, f.filename) for f in stack_frames]
-        idx_func_called, *_ = [i for i, _ in enumerate(stack_frames_sum) if _[0] == 'load_all_submodules']
-        package_file_path = stack_frames[idx_func_called + 1].filename
-    else:
-        package_file_path = __file__
-        calling_package_name = __name__
-
-    package_dir = Path(package_file_path).resolve().parent.as_posix()
-    for (_, module_name, _) in iter_modules([package_dir]):
-        # import the module and iterate through its attributes
-        module = import_module(f"{calling_package_name}.{module_name}")
-        for attribute_name in dir(module):
-            attribute = getattr(module, attribute_name)
-
-            if isclass(attribute):
-                # Add the class to this package's variables
-                globals()[attribute_name] = attribute
-
 
 def get_past_days(number_days: int = 1, offset=0) -> Generator:
     today = datetime.now()
@@ -73,6 +44,11 @@ def normalize_date(d: date | str, fmt: str = "%Y-%m-%d") -> date:
     return d
 
 
+def to_date(d: datetime.datetime | date | str) -> date:
+    """Normalize into a date e.g. for consistent keys whether datetime, date or text given"""
+    return d.date() if isinstance(d, datetime.datetime) else normalize_date(d)
+
+
 def get_days_between(
     from_: str | datetime.date, to_: str | datetime.date, as_text=True, fmt="%Y-%m-%d"
 ):
@@ -102,3 +78,10 @@ def get_last_log_lines(number_of_lines=20):
     f = get_file_sink_from_logger()
     lines = list(reversed([_ for _ in Path(f).read_text().split('\n') if not '/log' in _]))[:number_of_lines]
     return lines
+
+
+def write_atomic(path: Path, data: str | bytes) -> None:
+    """Write into temporary file renamed into path, readers see either the previous or the complete file"""
+    temp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    temp.write_bytes(data.encode() if isinstance(data, str) else data)
+    os.replace(temp, path)
@@ -1,21 +1,113 @@
 """Module for dynamically create a REST API based on classes registered"""
+import asyncio
+import base64
+import email.utils
+import gzip
+import hashlib
+import importlib.util
+import io
 import itertools
+import json
+import os
+import zipfile
+from typing import Iterable
 
 from fastapi_utils.enums import StrEnum
 from fastapi import Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from loguru import logger
 from makefun import create_function
 from fastapi import APIRouter, Request, HTTPException
-from metrics_collector.orchestrator.generic import Orchestrator
+from metrics_collector.orchestrator.generic import Orchestrator, ProgressBar
+from metrics_collector.orchestrator.jobs import JobQueue, JobStatus
+from metrics_collector.storage.cache import Cache
+from metrics_collector.storage.usage import UsageTracker
 import mimetypes
 from metrics_collector.load import GraphFormat
 import datetime
 
-from metrics_collector.utils import normalize_period
+from metrics_collector.__version__ import __version__
+from metrics_collector.utils import normalize_period, to_date, get_days_between
 
 graph_router = APIRouter()
+job_router = APIRouter()
 o = Orchestrator()
-DagName = StrEnum('DagName', o.get_dag_names())
+
+
+class BatchContainer(StrEnum):
+    json = 'json'
+    zip = 'zip'
+
+
+compressible_formats = (GraphFormat.html, GraphFormat.json)
+historical_max_age = int(os.getenv('HISTORICAL_MAX_AGE', 86400))  # seconds, a day extracted while in progress may be partial
+
+
+def get_encodings() -> tuple[str, ...]:
+    """Encodings supported in order of preference, brotli only if installed"""
+    return ('br', 'gzip') if importlib.util.find_spec('brotli') else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding: str, encodings: Iterable[str] | None = None) -> str | None:
+    """Preferred encoding supported by both client (by Accept-Encoding and its q-values) and server,
+    or of encodings if given such as those precompressed"""
+    accepted = {}
+    for part in filter(str.strip, accept_encoding.lower().split(',')):
+        name, _, param = part.partition(';')
+        try:
+            accepted[name.strip()] = float(param.strip().removeprefix('q=')) if param.strip() else 1.0
+        except ValueError:
+            continue
+    q = {_: accepted.get(_, accepted.get('*', 0.0)) for _ in encodings or get_encodings()}
+    return max((_ for _ in q if q[_] > 0), key=q.get, default=None)
+
+
+def encode(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        import brotli
+        return brotli.compress(body, quality=9)
+    return gzip.compress(body)
+
+
+def encoding_headers(encoding: str) -> dict:
+    return {'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+
+
+def compressed_response(content: str | bytes, media_type: str, request: Request | None, min_size=1000) -> Response:
+    """Response compressed (brotli or gzip) if accepted by client"""
+    body = content.encode() if isinstance(content, str) else content
+    encoding = negotiate_encoding(request.headers.get('accept-encoding', '') if request else '')
+    if encoding is None or len(body) < min_size:
+        return Response(content=body, media_type=media_type)
+    return Response(content=encode(body, encoding), media_type=media_type, headers=encoding_headers(encoding))
+
+
+def get_encoding(request: Request, format_) -> str | None:
+    """Encoding of graph response, None for formats not compressible such as png"""
+    if format_ not in compressible_formats:
+        return None
+    return negotiate_encoding(request.headers.get('accept-encoding', ''))
+
+
+async def cached_encoded_response(etag: str, encoding: str | None, media_type: str, headers: dict) -> Response | None:
+    """Graph compressed by an earlier request, served as is without rendering nor compressing"""
+    if encoding is None:
+        return None
+    body = await asyncio.to_thread(Cache.get_instance('graph_cache').get, f'encoded:{etag}:{encoding}')
+    if body is None:
+        return None
+    logger.debug(f'serving {len(body)} bytes {encoding} encoded graph {etag}')
+    return Response(content=body, media_type=media_type, headers={**headers, **encoding_headers(encoding)})
+
+
+async def encoded_response(content: str | bytes, etag: str, encoding: str | None, media_type: str, headers: dict, min_size=1000) -> Response:
+    """Graph response compressed by encoding, kept precompressed within the graph cache for following requests"""
+    body = content.encode() if isinstance(content, str) else content
+    if encoding is None or len(body) < min_size:
+        return Response(content=body, media_type=media_type, headers=headers)
+    body = await asyncio.to_thread(encode, body, encoding)
+    await asyncio.to_thread(Cache.get_instance('graph_cache').set, f'encoded:{etag}:{encoding}', body, compress=False)
+    return Response(content=body, media_type=media_type, headers={**headers, **encoding_headers(encoding)})
 
 
 def rest_get_extract_params(query_params, dag_name, orchestrator):
@@ -26,13 +118,14 @@ def rest_get_extract_params(query_params, dag_name, orchestrator):
     return extract_params
 
 
-def graph(**args):
+async def graph(**args):
     """Accepts arguments by dynamically generated parameters and generates graph data
     Expected arguments
     graph: GraphEnum.graph (which graph)
     format: GraphFormat (enum such as GraphFormat.png)
     from_date: YYYY-MM-DD
     to_date: YYYY-MM-DD
+    background: return a job to poll at /jobs/{job_id} rather than waiting for the graph
 
     Depending which LoadClass e.g.
     apple_uri_health_data: str (if None use cached)
@@ -45,48 +138,231 @@ def graph(**args):
     logger.debug(f'{args=}')
     dag_name = args['request'].scope['path'].split('/').pop()
     logger.debug(f'{dag_name=}')
-    any_params_none = any([_ is None for _ in args.values()])
     from_ = args['from_date']
     to_ = args['to_date']
     graph_name = args['graph']
 
+    extract_params = get_extract_params(dag_name, args)
+
+    await asyncio.to_thread(UsageTracker.record, dag_name, from_, to_, graph_name, args['format'])
+    if args.get('background', False):
+        job = await JobQueue.get_instance().submit(
+            graph_job_key(dag_name, graph_name, args['format'], from_, to_, extract_params),
+            lambda progress_bar: get_graph_result(dag_name, graph_name, args['format'], from_, to_, extract_params, progress_bar),
+            media_type,
+        )
+        return JSONResponse(job.asdict(), status_code=202, headers={'Location': f'/jobs/{job.id}'})
+    request, format_ = args['request'], args['format']
+    encoding = get_encoding(request, format_)
+    from_, to_ = normalize_period(from_, to_)
+    extract_objects = o.get_extract_objects(dag_name, extract_params)
+    extracted = await asyncio.to_thread(is_extracted, extract_objects, from_, to_)
+    historical = is_historical(to_) and extracted
+    etag = None
+    if extracted:  # known before processing as nothing is left to extract
+        data_version = await asyncio.to_thread(get_data_version, extract_objects)
+        etag = graph_etag(dag_name, graph_name, format_, from_, to_, data_version)
+        headers = cache_headers(etag, historical, data_version)
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        if response := await cached_encoded_response(etag, encoding, media_type, headers):
+            return response
+    transform_object = await get_transform_object(dag_name, extract_objects, from_, to_)
+    if etag is None:
+        etag = graph_etag(dag_name, graph_name, format_, from_, to_, transform_object.data_version)
+        headers = cache_headers(etag, historical, transform_object.data_version)
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        if response := await cached_encoded_response(etag, encoding, media_type, headers):
+            return response
+    graph_result = await o.aget_graph(graph_name, from_, to_, dag_name, transform_object, format_)
+    return await encoded_response(graph_result, etag, encoding, media_type, headers)
+
+
+async def graphs(**args):
+    """Accepts arguments by dynamically generated parameters and generates all graphs (or the subset given
+    as graph comma separated) of a period in one response, extracting and processing once while graphs
+    rendered concurrently.
+    Expected arguments
+    graph: graph names separated by comma, all if not given
+    format: GraphFormat of each graph
+    container: BatchContainer, json map of graph name to graph (figure JSON, html or base64 encoded png) or zip
+    from_date: YYYY-MM-DD
+    to_date: YYYY-MM-DD
+    """
+    request, format_, container = args['request'], args['format'], args['container']
+    dag_name = request.scope['path'].rstrip('/').split('/')[-2]
+    all_graph_names = o.get_graph_names(dag_name)
+    graph_names = [_.strip() for _ in args['graph'].split(',') if _.strip()] if args['graph'] else all_graph_names
+    if unknown := set(graph_names) - set(all_graph_names):
+        raise HTTPException(400, f'unknown graphs {", ".join(sorted(unknown))}')
+    extract_params = get_extract_params(dag_name, {k: v for k, v in args.items() if k != 'graph'})
+    from_, to_ = normalize_period(args['from_date'], args['to_date'])
+    for graph_name in graph_names:
+        await asyncio.to_thread(UsageTracker.record, dag_name, from_, to_, graph_name, format_)
+
+    extract_objects = o.get_extract_objects(dag_name, extract_params)
+    transform_object = await get_transform_object(dag_name, extract_objects, from_, to_)
+    pipeline_graphs = None if set(graph_names) == set(all_graph_names) else tuple(graph_names)  # processed once for all
+    results = await asyncio.gather(
+        *(o.aget_graph(_, from_, to_, dag_name, transform_object, format_, pipeline_graphs) for _ in graph_names)
+    )
+    graphs_ = dict(zip(graph_names, results))
+    if container == BatchContainer.zip:
+        file_name = f'{dag_name}_{to_date(from_)}_{to_date(to_)}.zip'
+        content = await asyncio.to_thread(batch_zip, graphs_, format_)
+        return Response(content=content, media_type='application/zip', headers={'Content-Disposition': f'attachment; filename="{file_name}"'})
+    return compressed_response(batch_json(graphs_, format_), mimetypes.types_map['.json'], request)
+
+
+def batch_json(graphs_: dict[str, str | bytes], format_) -> str:
+    """Map of graph name to graph, figures as JSON, html as text and png as base64"""
+    if format_ == GraphFormat.json:  # already JSON, avoid parsing and serializing again
+        return '{' + ', '.join(f'{json.dumps(name)}: {graph}' for name, graph in graphs_.items()) + '}'
+    if format_ == GraphFormat.png:
+        return json.dumps({name: base64.b64encode(graph).decode() for name, graph in graphs_.items()})
+    return json.dumps(graphs_)
+
+
+def batch_zip(graphs_: dict[str, str | bytes], format_) -> bytes:
+    """Zip of graphs named by graph name, png stored as already compressed"""
+    buffer = io.BytesIO()
+    compression = zipfile.ZIP_STORED if format_ == GraphFormat.png else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(buffer, 'w', compression) as f:
+        for name, graph in graphs_.items():
+            f.writestr(f'{name}.{getattr(format_, "value", format_)}', graph)
+    return buffer.getvalue()
+
+
+def get_extract_params(dag_name, args) -> dict:
+    """Extract parameters given by args, or those stored when any not given"""
     required_params = set(itertools.chain.from_iterable([_.keys() for _ in o.get_extract_params_def(dag_name)]))
+    if not any(_ is None for _ in args.values()):
+        return args
     extract_params = o.get_stored_params(dag_name)
-    if any_params_none and set(extract_params.keys()) == required_params:
-        extract_params = o.get_stored_params(dag_name)
-    elif any_params_none:
-        return HTTPException(400, 'missing parameters')
-    else:
-        extract_params = args
+    if set(extract_params.keys()) != required_params:
+        raise HTTPException(400, 'missing parameters')
+    return extract_params
 
-    extract_objects = o.get_extract_objects(dag_name, extract_params)
-    o.process_dates(extract_objects, from_, to_, progress_bar=None)
+
+async def get_transform_object(dag_name, extract_objects, from_, to_, progress_bar: ProgressBar | None = None):
+    await o.aprocess_dates(extract_objects, from_, to_, progress_bar=progress_bar)
     logger.debug('completed processing dates')
-    transform_object = o.get_transform_object(dag_name, extract_objects)  # Important to be used next step
+    return await o.aget_transform_object(dag_name, extract_objects)  # Important to be used next step
+
+
+async def get_graph_result(dag_name, graph_name, format_, from_, to_, extract_params, progress_bar: ProgressBar | None = None):
+    extract_objects = o.get_extract_objects(dag_name, extract_params)
+    transform_object = await get_transform_object(dag_name, extract_objects, from_, to_, progress_bar)
     logger.debug('processing and rendering graph')
     from_, to_ = normalize_period(from_, to_)
-    graph_result = o.get_graph(graph_name, from_, to_, dag_name, transform_object, args['format'])
-    return Response(content=graph_result, media_type=media_type)
+    return await o.aget_graph(graph_name, from_, to_, dag_name, transform_object, format_)
+
+
+def is_historical(to_, settle_days=1) -> bool:
+    """Period ended settle_days (allowing late data) before today"""
+    return to_date(to_) < datetime.date.today() - datetime.timedelta(days=settle_days)
+
+
+def is_extracted(extract_objects, from_, to_) -> bool:
+    """All days of period already extracted, as days are never extracted again its data can't change"""
+    days = list(get_days_between(from_, to_))
+    return all(not _.get_missing_days(days) for _ in extract_objects)
+
+
+def get_data_version(extract_objects) -> tuple:
+    """Version of the extracted data, same as of the transform object made of extract_objects"""
+    return tuple(_.get_data_version() for _ in extract_objects)
+
+
+def graph_etag(dag_name, graph_name, format_, from_, to_, data_version) -> str:
+    """Weak ETag (as content may differ by encoding) of graph by parameters and the version of its data"""
+    key = (__version__, dag_name, getattr(graph_name, 'value', graph_name), getattr(format_, 'value', format_), f'{to_date(from_)}', f'{to_date(to_)}', data_version)
+    return f'W/"{hashlib.sha1(repr(key).encode()).hexdigest()[:24]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    tags = {_.strip().removeprefix('W/') for _ in request.headers.get('if-none-match', '').split(',')}
+    return '*' in tags or etag.removeprefix('W/') in tags
+
+
+def cache_headers(etag: str, historical: bool, data_version: tuple | None = None) -> dict:
+    """Historical graphs are cached for historical_max_age while others revalidated, both by ETag and modified time of its data"""
+    headers = {'ETag': etag, 'Cache-Control': f'public, max-age={historical_max_age}' if historical else 'no-cache'}
+    if modified := [int(_.split('-')[0]) for _ in data_version or () if _]:
+        headers['Last-Modified'] = email.utils.formatdate(max(modified) / 1e9, usegmt=True)
+    return headers
+
+
+def graph_job_key(dag_name, graph_name, format_, from_, to_, extract_params) -> tuple:
+    """Identical requests share the same job, parameters (such as passwords) only as a hash"""
+    params_hash = hashlib.sha1(repr(sorted((k, f'{v}') for k, v in extract_params.items())).encode()).hexdigest()
+    return 'graph', dag_name, getattr(graph_name, 'value', graph_name), getattr(format_, 'value', format_), f'{from_}', f'{to_}', params_hash
+
+
+def get_job_or_404(job_id: str):
+    if (job := JobQueue.get_instance().get(job_id)) is None:
+        raise HTTPException(404, f'job {job_id} not found or expired')
+    return job
+
+
+@job_router.get('/{job_id}')
+def job_status(job_id: str):
+    """Status and progress of a job"""
+    return get_job_or_404(job_id).asdict()
+
+
+@job_router.get('/{job_id}/events')
+async def job_events(job_id: str):
+    """Server-sent events with the status of a job until finished"""
+    get_job_or_404(job_id)
+
+    async def stream():
+        async for status in JobQueue.get_instance().events(job_id):
+            yield f'event: status\ndata: {json.dumps(status)}\n\n'
+
+    return StreamingResponse(stream(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@job_router.get('/{job_id}/result')
+def job_result(job_id: str, request: Request):
+    """Result of a finished job, 202 while still in progress"""
+    job = get_job_or_404(job_id)
+    if job.status is JobStatus.failed:
+        raise HTTPException(500, job.error)
+    if not job.is_finished:
+        return JSONResponse(job.asdict(), status_code=202)
+    if job.media_type == mimetypes.types_map['.json']:
+        return compressed_response(job.result, job.media_type, request)
+    return Response(content=job.result, media_type=job.media_type)
 
 
-# Some magic to dynamically create API endpoints
-for dag_name in o.get_dag_names():
-    dag_args = o.get_extract_services_and_parameters().get(dag_name)
-    all_args = []
+def add_graph_routes(router: APIRouter = graph_router) -> APIRouter:
+    """Some magic to dynamically create API endpoints of the dags registered, called as the web service
+    starts rather than when imported"""
+    for dag_name in o.get_dag_names():
+        dag_args = o.get_extract_services_and_parameters().get(dag_name, {})
+        all_args = []
 
-    graph_names = o.get_graph_names(dag_name)  # get all graph names options
-    GraphEnum = StrEnum('GraphEnum', graph_names)
-    all_args.append(f'graph: GraphEnum')
-    all_args.append('format: GraphFormat')
+        graph_names = o.get_graph_names(dag_name)  # get all graph names options
+        GraphEnum = StrEnum('GraphEnum', graph_names)
+        all_args.append(f'graph: GraphEnum')
+        all_args.append('format: GraphFormat')
+        all_args.append('background: bool = False')
 
-    for arg_name, default_date in (('from_date', 'today() - datetime.timedelta(days=1)'), ('to_date', 'today()')):
-        all_args.append(f'{arg_name}: datetime.date | str = datetime.date.{default_date}')
+        for arg_name, default_date in (('from_date', 'today() - datetime.timedelta(days=1)'), ('to_date', 'today()')):
+            all_args.append(f'{arg_name}: datetime.date | str = datetime.date.{default_date}')
 
-    for cls, args in dag_args.items():  # add args for extract class
-        for arg, type_ in args.items():
-            all_args.append(f'{arg}: {type_.__name__} | None=None')
-    all_args.append(f'request: Request = None')
+        for cls, args in dag_args.items():  # add args for extract class
+            for arg, type_ in args.items():
+                all_args.append(f'{arg}: {type_.__name__} | None=None')
+        all_args.append(f'request: Request = None')
 
-    gen_func = create_function(f'{dag_name}({", ".join(all_args)})', graph)
-    graph_router.add_api_route(f'/{dag_name}', gen_func)
+        gen_func = create_function(f'{dag_name}({", ".join(all_args)})', graph)
+        router.add_api_route(f'/{dag_name}', gen_func)
 
+        batch_args = [_ for _ in all_args if _.split(':')[0] not in ('graph', 'format', 'background')]
+        batch_args[:0] = ['graph: str | None = None', 'format: GraphFormat = GraphFormat.json', 'container: BatchContainer = BatchContainer.json']
+        batch_func = create_function(f'{dag_name}_batch({", ".join(batch_args)})', graphs)
+        router.add_api_route(f'/{dag_name}/batch', batch_func)
+    return router
@@ -1,4 +1,8 @@
 import datetime
+import functools
+import mimetypes
+import os
+import threading
 from pathlib import Path
 from typing import Iterable
 
@@ -6,18 +10,24 @@ import uvicorn
 from loguru import logger
 import asyncio
 from uvicorn_loguru_integration import run_uvicorn_loguru
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse
 from pywebio.platform.fastapi import asgi_app
 
-from metrics_collector.scheduler.api import AsyncService
-from metrics_collector.web.rest import graph_router
+from metrics_collector.load.render import RendererPool
+from metrics_collector.scheduler.api import AsyncService, MyScheduler, get_snapshot_dir
+from metrics_collector.orchestrator.progress import ProgressTracker
+from metrics_collector.storage.cache import Cache
+from metrics_collector.web.rest import add_graph_routes, job_router, encode, encoding_headers, etag_matches, negotiate_encoding
 from metrics_collector.web.ui import ui_show, ui_add_schedule, ui_remove_schedule
 from metrics_collector.utils import get_last_log_lines
 
 app = FastAPI()
-app.include_router(graph_router, prefix='/graph')
+app.include_router(job_router, prefix='/jobs')
 
 
 @app.get('/')
@@ -30,6 +40,65 @@ def get_log():
     return '<br/>'.join(get_last_log_lines(20))
 
 
+@app.get('/cache')
+def get_cache_stats():
+    return {name: Cache.get_instance(name).stats() for name in ('graph_cache', 'rollup_cache')}
+
+
+@app.get('/scheduler')
+def get_scheduler_metrics():
+    return MyScheduler._instance.get_metrics() if MyScheduler._instance else {}
+
+
+@app.get('/progress')
+def get_progress():
+    return {extractor: event.asdict() for extractor, event in ProgressTracker.latest().items()}
+
+
+@functools.cache
+def get_plotlyjs(encoding: str | None = None) -> bytes:
+    """plotly.js bundled with plotly, the same version the figures are made by, encoded once"""
+    from plotly.offline import get_plotlyjs
+    body = get_plotlyjs().encode()
+    return encode(body, encoding) if encoding else body
+
+
+@app.get('/static/plotly.min.js')
+def get_plotlyjs_route(request: Request):
+    """Served rather than a CDN version possibly not matching the figures"""
+    import plotly
+    etag = f'"plotly-{plotly.__version__}"'
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=86400', 'Vary': 'Accept-Encoding'}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if encoding := negotiate_encoding(request.headers.get('accept-encoding', '')):
+        headers.update(encoding_headers(encoding))
+    return Response(get_plotlyjs(encoding), media_type='application/javascript', headers=headers)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """Static files served from their precompressed .gz sibling when accepted by the client, such as snapshots"""
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        if not os.path.isfile(f'{full_path}.gz'):
+            return super().file_response(full_path, stat_result, scope, status_code)
+        if negotiate_encoding(request_headers.get('accept-encoding', ''), ('gzip',)) is None:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+            response.headers['Vary'] = 'Accept-Encoding'  # as the same path is served encoded to others
+            return response
+        response = FileResponse(
+            f'{full_path}.gz',
+            status_code=status_code,
+            media_type=mimetypes.guess_type(str(full_path))[0] or 'text/plain',
+            headers=encoding_headers('gzip'),
+            method=scope['method'],
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
 class WebServer:
 
     async_services_start_method = None
@@ -56,12 +125,22 @@ class WebServer:
         for service in WebServer.extra_async_services:
             logger.debug(f"starting {service}")
             service.start()
+        threading.Thread(target=RendererPool.get_instance().warm_up, daemon=True).start()
 
     def mounts(self):
+        app.include_router(add_graph_routes(), prefix='/graph')  # once dags are registered by loading plugins
         app.mount("/action/show", asgi_app(ui_show))
         app.mount("/action/add_schedule", asgi_app(ui_add_schedule))
         app.mount('/action/remove_schedule', asgi_app(ui_remove_schedule))
-        app.mount("/static", StaticFiles(directory=Path(__file__).parent / 'static', html=True), name="static")
+        self.mount_static()
+
+    @staticmethod
+    def mount_static():
+        """Snapshots mounted ahead of other static files as being within their path"""
+        snapshot_dir = get_snapshot_dir()
+        snapshot_dir.mkdir(parents=True, exist_ok=True)
+        app.mount("/static/snapshots", PrecompressedStaticFiles(directory=snapshot_dir, html=True), name="snapshots")
+        app.mount("/static", PrecompressedStaticFiles(directory=Path(__file__).parent / 'static', html=True), name="static")
 
     def start(self):
         self.server.serve()
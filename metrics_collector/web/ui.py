@@ -2,18 +2,24 @@ import datetime
 import itertools
 import json
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import partial
 from typing import Type, Annotated
 import pywebio.input
 from parsedatetime import Calendar
 from pywebio import config
-from pywebio.input import input, radio, select, input_group, PASSWORD
-from pywebio.output import put_html, put_processbar, set_processbar, put_text, clear, put_table, put_buttons, popup
+from pywebio.input import input, radio, select, input_group, PASSWORD, NUMBER
+from pywebio.output import put_html, put_processbar, set_processbar, put_text, clear, put_table, put_buttons, popup, \
+    put_scope, use_scope
+from pywebio.session import register_thread
 from metrics_collector.orchestrator.generic import Orchestrator, ProgressBar
+from metrics_collector.orchestrator.progress import ProgressEvent
+from metrics_collector.storage.usage import UsageTracker
 from loguru import logger
 
 from metrics_collector.utils import normalize_date
-from metrics_collector.scheduler.api import MyScheduler, EmailAction, scheduler_config_file, get_scheduler_config, \
+from metrics_collector.scheduler.api import MyScheduler, EmailAction, SnapshotAction, scheduler_config_file, get_scheduler_config, \
     save_scheduler_config, ActionType, BaseAction, BaseScheduleParams, ScheduleConfig
 from metrics_collector.scheduler import ScheduleParams
 
@@ -25,10 +31,21 @@ class WebProgressBar(ProgressBar):
         self.current = 0
         self._name = 'download_bar'
         put_processbar(self._name)
+        put_scope('download_stats')
 
     def update(self, progress: Annotated[float, "Between 0 and 1"]) -> None:
         set_processbar(self._name, progress)
 
+    def on_progress(self, event: ProgressEvent) -> None:
+        try:
+            self.update(event.overall_progress)
+            with use_scope('download_stats', clear=True):
+                put_text(f'{event}')
+        except Exception as e:
+            logger.error(f'error updating progress bar: {e}')
+            if "Can't find current session" in f"{e}":
+                logger.info('Web browser session most likely disconnected and this process will continue in background till completion')
+
 
 def space_shifter(text: str) -> str:
     if '_' in text:
@@ -111,6 +128,7 @@ def ui_get_schedule_options() -> ScheduleParams:
             return 'year', f'{message}, check http://shorturl.at/bjOP0'
 
     fields = [input(_, type='text', name=_) for _ in ('year', 'month', 'day', 'day_of_week', 'hour', 'minute')]
+    fields.append(input('jitter', type=NUMBER, name='jitter', value=0, help_text='delay each run randomly by up to seconds'))
     form: ScheduleParams = ScheduleParams(**input_group('Schedule', fields, validate=check_form))
     logger.info(f'valid params {form}')
     return form
@@ -178,39 +196,92 @@ def ui_get_email_properties() -> EmailAction:
     return EmailAction(**data)
 
 
+def ui_get_snapshot_properties() -> SnapshotAction:
+    data = input_group("Snapshot properties", [
+        input('Name', name='name', placeholder='last_90_days', help_text='published at /static/snapshots/<dag>/<name>/'),
+        input('Versions kept', type=NUMBER, name='keep', value=3)
+    ], validate=lambda d: ('name', 'Only letters, digits, - and _') if not re.match(r'^[\w-]+$', d['name']) else None)
+    return SnapshotAction(**data)
+
+
 def ui_get_action_options() -> tuple[ActionType, BaseAction]:
     """Present the options for scheduler"""
     clear()
-    selection = select('What action', ['Email', 'Cache'])
+    selection = select('What action', ['Email', 'Cache', 'Snapshot'])
     action_type = getattr(ActionType, selection)
-    action_properties = ui_get_email_properties() if action_type == ActionType.Email else None
+    get_properties = {ActionType.Email: ui_get_email_properties, ActionType.Snapshot: ui_get_snapshot_properties}
+    action_properties = get_properties[action_type]() if action_type in get_properties else None
     return action_type, action_properties
 
 
+def ui_render_graphs(o: Orchestrator, dag_name, from_, to_, extract_objects, graph_names, preview=False):
+    """Render graphs concurrently and put each into its placeholder scope as soon as ready"""
+    try:
+        transform_object = o.get_transform_object(dag_name, extract_objects)
+    except Exception as e:
+        logger.warning(f'Unable to transform {"cached " if preview else ""}data: {e}')
+        return
+    if not preview:
+        for graph_name in graph_names:
+            UsageTracker.record(dag_name, from_, to_, graph_name, 'html')
+    with ThreadPoolExecutor(max_workers=len(graph_names) or 1) as executor:
+        futures = {executor.submit(o.get_graph, graph_name, from_, to_, dag_name, transform_object, 'html', tuple(graph_names)): graph_name for graph_name in graph_names}
+        for future in as_completed(futures):
+            graph_name = futures[future]
+            try:
+                graph_data = future.result()
+            except Exception as e:
+                logger.warning(f'Unable to render {graph_name}: {e}')
+                if not preview:
+                    with use_scope(graph_name, clear=True):
+                        put_text(f'Unable to render {space_shifter(graph_name)}: {e}')
+                continue
+            with use_scope(graph_name, clear=True):
+                put_html(graph_data)
+                if preview:
+                    put_text('Based on cached data, updating when processing completes...')
+
+
 @config(theme='dark')
 def ui_show():
     """This is the main UI for get input and plot graphs to the screen"""
     o = Orchestrator()
     dag_name, from_, to_ = ui_get_service_and_interval(o)
+    graph_names = o.get_graph_names(dag_name)
     carry_on = False
     while not carry_on:
         try:
             clear()
             extract_params = get_extract_params(dag_name, o)  # determine if params already stored
             extract_objects = o.get_extract_objects(dag_name, extract_params)  # required with extract_params as dict
-            put_text('Processing data from services')
-            put_text('Note: make sure your browser is connected and device does not go to sleep...')
-            pb = WebProgressBar()
-            o.process_dates(extract_objects, from_, to_, progress_bar=pb)
+            clear()
+            put_scope('progress')
+            for graph_name in graph_names:
+                put_scope(graph_name, [put_text(f'{space_shifter(graph_name)} ...')])  # placeholders
+            if not any(o.get_missing_days(extract_objects, from_, to_).values()):
+                break
+            with use_scope('progress'):
+                put_text('Processing data from services')
+                put_text('Note: make sure your browser is connected and device does not go to sleep...')
+                pb = WebProgressBar()
+            errors = []
+
+            def extract():
+                try:
+                    o.process_dates(extract_objects, from_, to_, progress_bar=pb)
+                except Exception as e:
+                    errors.append(e)
+
+            extraction = threading.Thread(target=extract, daemon=True)
+            register_thread(extraction)
+            extraction.start()
+            ui_render_graphs(o, dag_name, from_, to_, extract_objects, graph_names, preview=True)  # meanwhile from cache
+            extraction.join()
+            if errors:
+                raise errors[0]
             carry_on = True
         except Exception as e:
             logger.error(f'Error extracting data: {e}')
             popup(f'Error: {e}')
-    set_processbar('download_bar', 1)   # To assure it shows 100%
-    put_text('Massaging data and rendering charts')
-
-    transform_object = o.get_transform_object(dag_name, extract_objects)  # Important to be used next step
-
-    clear()
-    for graph_data in o.get_all_graphs(from_, to_, dag_name, transform_object, 'html'):  # Used to get graph results
-        put_html(graph_data)
+    clear('progress')
+    ui_render_graphs(o, dag_name, from_, to_, extract_objects, graph_names)
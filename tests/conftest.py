@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """Keep caches and files written by tests, e.g. rollups of each load graph, out of the user data dir"""
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    return tmp_path
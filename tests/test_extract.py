@@ -10,6 +10,8 @@ from metrics_collector.extract.base import (
 )
 from dataclasses import dataclass
 
+from metrics_collector.orchestrator.generic import restored_registry
+
 mock_days_metrics = {
     "2022-01-01": {
         "running": {"value": 300, "unit": "meter"},
@@ -27,21 +29,27 @@ class SampleExtractParameters(BaseExtractParameters):
     uri_for_sample_service: str
 
 
-class SampleExtract(BaseExtract):
-    dag_name = "foo"
+@pytest.fixture
+def sample_extract_class():
+    with restored_registry():
+
+        class SampleExtract(BaseExtract):
+            dag_name = "foo"
+
+            def __init__(self, parameters: BaseExtractParameters):
+                self.parameters = parameters
 
-    def __init__(self, parameters: BaseExtractParameters):
-        self.parameters = parameters
+            def get_data_from_service(self, date_: str) -> DaysMetrics:
+                mock_data: dict = mock_days_metrics
+                return mock_data[date_]
 
-    def get_data_from_service(self, date_: str) -> DaysMetrics:
-        mock_data: dict = mock_days_metrics
-        return mock_data[date_]
+        yield SampleExtract
 
 
 @pytest.fixture
-def extract_obj():
+def extract_obj(sample_extract_class):
     params = SampleExtractParameters(uri_for_sample_service="foo://my_service")
-    extract_obj_ = SampleExtract(params)
+    extract_obj_ = sample_extract_class(params)
     return extract_obj_
 
 
@@ -76,3 +84,21 @@ def test_extract_obj_to_json(extract_obj):
 
 def test_extract_obj_to_df(extract_obj):
     df = extract_obj.to_df()
+
+
+def test_extract_obj_missing_days(extract_obj, tmp_path, monkeypatch):
+    cache_file = (tmp_path / "SampleExtract.json").as_posix()
+    monkeypatch.setattr(extract_obj, "get_cache_file", lambda: cache_file)
+    assert extract_obj.get_missing_days(["2022-01-01"]) == ["2022-01-01"]
+    extract_obj.to_json(cache_file, mock_days_metrics)
+    assert extract_obj.get_missing_days(["2022-01-01", "2022-01-02", "2022-01-03"]) == ["2022-01-02"]
+
+
+def test_extract_obj_to_json_is_atomic(extract_obj, tmp_path):
+    cache_file = tmp_path / "SampleExtract.json"
+    extract_obj.to_json(cache_file.as_posix(), {"2022-01-01": mock_days_metrics["2022-01-01"]})
+    before = cache_file.stat().st_ino
+    extract_obj.to_json(cache_file.as_posix(), {"2022-01-03": mock_days_metrics["2022-01-03"]})
+    assert cache_file.stat().st_ino != before  # replaced rather than truncated in place
+    assert json.loads(cache_file.read_text()) == mock_days_metrics
+    assert [_.name for _ in tmp_path.iterdir()] == ["SampleExtract.json"]
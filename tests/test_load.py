@@ -1,42 +1,59 @@
 import datetime
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import Iterable, Annotated, Callable
 
+import pandas as pd
 import plotly
 import plotly.graph_objects as go
 import pytest
 from metrics_collector.load.base import GraphFormat
 
 from metrics_collector.load.base import BaseLoadGraph
-from .test_extract import extract_obj
-from .test_transform import transform_obj
+from metrics_collector.load.downsample import lttb_indices, downsample_figure
+from metrics_collector.load.graph import GarminAppleLoadGraph
+from metrics_collector.exceptions import MetricsRenderException
+from metrics_collector.load.render import RendererPool
+from metrics_collector.load.rollup import Rollup
+from metrics_collector.orchestrator.generic import restored_registry
+from .test_extract import extract_obj, sample_extract_class
+from .test_transform import transform_obj, foo_transform_class, garmin_apple_transform_obj
 
 
-class FooLoadGraph(BaseLoadGraph):
-    dag_name = "foo"
+@pytest.fixture
+def foo_load_graph_class():
+    with restored_registry():
+
+        class FooLoadGraph(BaseLoadGraph):
+            dag_name = "foo"
+
+            def get_all_graph_methods(
+                self,
+            ) -> Iterable[Annotated[Callable, "Class methods generating graphs"]]:
+                return (self.graph_foo,)
 
-    def get_all_graph_methods(
-        self,
-    ) -> Iterable[Annotated[Callable, "Class methods generating graphs"]]:
-        return (self.graph_foo,)
+            def to_html(self, graph_method: Callable) -> str:
+                return graph_method().to_html(include_plotlyjs="require", full_html=False)
 
-    def to_html(self, graph_method: Callable) -> str:
-        return graph_method().to_html(include_plotlyjs="require", full_html=False)
+            def to_png(self, graph_method: Callable) -> bytes:
+                return graph_method().to_image(format="png")
 
-    def to_png(self, graph_method: Callable) -> bytes:
-        return graph_method().to_image(format="png")
+            def graph_foo(self) -> plotly.graph_objects.Figure:
+                df = self.df
+                fig = go.Figure()
+                fig.add_trace(
+                    go.Bar(x=df.index, y=df.running, name="Running distance", yaxis="y")
+                )
+                return fig
 
-    def graph_foo(self) -> plotly.graph_objects.Figure:
-        df = self.df
-        fig = go.Figure()
-        fig.add_trace(
-            go.Bar(x=df.index, y=df.running, name="Running distance", yaxis="y")
-        )
-        return fig
+        yield FooLoadGraph
 
 
 @pytest.fixture
-def load_graph_obj(transform_obj):
-    obj = FooLoadGraph(
+def load_graph_obj(transform_obj, foo_load_graph_class):
+    obj = foo_load_graph_class(
         transform_obj, datetime.date(2022, 1, 1), datetime.date(2022, 1, 10)
     )
     return obj
@@ -59,3 +76,134 @@ def test_get_graphs_png(load_graph_obj):
     png_bytes = next(load_graph_obj.get_all_graphs(GraphFormat.png))
     assert isinstance(png_bytes, bytes), "Expected PNG bytes"
     assert len(png_bytes) > 10_000, "Expected byte larger than 10KB"
+
+
+@pytest.fixture
+def daily_df():
+    index = pd.date_range("2022-01-01", periods=28, freq="D")
+    return pd.DataFrame({"running": range(28), "walking": 1.0}, index=index)
+
+
+def test_rollup_memoizes_resampling(daily_df, mocker):
+    rollup = Rollup(daily_df, persist=False)
+    spy = mocker.spy(daily_df, "resample")
+    weekly = rollup.get("W", "sum")
+    weekly["running"] = 0  # modifying the returned copy should not leak into the rollup
+    assert rollup.get("W", "sum").equals(daily_df.resample("W").sum())
+    rollup.get("W", "max")
+    assert spy.call_count == 3, "Expected one resample per (resolution, aggregation) and one for comparison"
+
+
+def test_rollup_persisted(daily_df, tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    expected = Rollup(daily_df).get("M", {"running": "max", "walking": "count"})
+    rollup = Rollup(daily_df.copy())
+    rollup.df = None  # any attempt to resample would fail
+    assert rollup.get("M", {"walking": "count", "running": "max"}).equals(expected)
+
+
+class SlowScope:
+    def _ensure_kaleido(self):
+        ...
+
+    def transform(self, figure, format):
+        time.sleep(0.2)
+        return f"{figure}.{format}".encode()
+
+
+def test_renderer_pool_renders_in_parallel(monkeypatch):
+    monkeypatch.setattr(RendererPool, "_new_scope", lambda self: SlowScope())
+    pool = RendererPool(workers=4)
+    pool.warm_up()
+    start = time.time()
+    assert pool.render_many(["a", "b", "c", "d"]) == [b"a.png", b"b.png", b"c.png", b"d.png"]
+    assert time.time() - start < 0.6, "Expected renders being done in parallel"
+
+
+def test_renderer_pool_bounded_queue(monkeypatch):
+    monkeypatch.setattr(RendererPool, "_new_scope", lambda self: SlowScope())
+    pool = RendererPool(workers=1, max_queue=1, timeout=0.1)
+    pool.submit("a"), pool.submit("b")
+    with pytest.raises(MetricsRenderException):
+        pool.submit("c")
+
+
+class HungScope:
+    def __init__(self):
+        self.stopped = threading.Event()
+
+    def transform(self, figure, format):
+        self.stopped.wait(5)
+        raise RuntimeError("kaleido process stopped")
+
+    def _shutdown_kaleido(self):
+        self.stopped.set()
+
+
+def test_renderer_pool_replaces_hung_scope(monkeypatch):
+    hung = HungScope()
+    scopes = iter([hung, SlowScope()])
+    monkeypatch.setattr(RendererPool, "_new_scope", lambda self: next(scopes))
+    pool = RendererPool(workers=1, timeout=0.5)
+    with pytest.raises(MetricsRenderException):
+        pool.render("a")
+    assert hung.stopped.wait(1)
+    assert pool.render("b") == b"b.png", "Hung renderer should be replaced"
+
+
+def test_renderer_pool_failing_start_not_counted(monkeypatch):
+    def fail(self):
+        raise MetricsRenderException("no kaleido")
+
+    monkeypatch.setattr(RendererPool, "_new_scope", fail)
+    pool = RendererPool(workers=2)
+    with pytest.raises(MetricsRenderException):
+        pool.render("a")
+    pool.warm_up()
+    assert pool._scopes_created == 0
+    monkeypatch.setattr(RendererPool, "_new_scope", lambda self: SlowScope())
+    assert pool.render("b") == b"b.png"
+
+
+def render_with_shared_pool(figure):
+    return RendererPool.get_instance().render(figure)
+
+
+def test_renderer_pool_within_forked_render_executor(monkeypatch):
+    """Scheduler "render" executor forks once the web service warmed the shared pool"""
+    monkeypatch.setattr(RendererPool, "_new_scope", lambda self: SlowScope())
+    monkeypatch.setattr(RendererPool, "_instance", None)
+    parent_pool = RendererPool.get_instance()
+    parent_pool.warm_up()
+    assert parent_pool.render("a") == b"a.png"
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("fork")) as executor:
+        assert executor.submit(render_with_shared_pool, "b").result(timeout=10) == b"b.png"
+    assert RendererPool.get_instance() is parent_pool
+    parent_pool.shutdown()
+
+
+def test_lttb_keeps_shape():
+    x = pd.date_range("2018-01-01", periods=5000, freq="D")
+    y = [0.0] * 5000
+    y[2500] = 100.0  # a single peak must survive
+    indices = lttb_indices(x.values, y, 100)
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 4999
+    assert 2500 in indices
+
+
+def test_downsample_figure_caps_points():
+    x = pd.date_range("2018-01-01", periods=5000, freq="D")
+    fig = go.Figure([go.Scatter(x=x, y=list(range(5000))), go.Bar(x=x, y=list(range(5000)))])
+    fig = downsample_figure(fig, 500)
+    assert [len(_.y) for _ in fig.data] == [500, 500]
+    assert len(fig.data[0].x) == 500
+
+
+def test_garmin_apple_graphs_downsampled_over_long_period(garmin_apple_transform_obj):
+    load = GarminAppleLoadGraph(garmin_apple_transform_obj, datetime.date(2013, 1, 1), datetime.date(2022, 12, 31))
+    for graph_method in (load.graph_weekly_weight, load.graph_weekly_distance):
+        weeks = len(graph_method().data[0].y)
+        assert weeks > load.max_points, "Ten years of weeks should exceed max_points"
+        assert all(len(_.y) <= load.max_points for _ in load.get_figure(graph_method).data)
+    assert 'class="plotly-graph-div"' in load.to_html(load.graph_weekly_weight)
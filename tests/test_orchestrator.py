@@ -0,0 +1,351 @@
+import asyncio
+import dataclasses
+import threading
+import time
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import pytest
+
+from metrics_collector.orchestrator.generic import (
+    PipelineMemo,
+    SingleFlight,
+    Executors,
+    Orchestrator,
+    DagPlan,
+    ClassType,
+    caching,
+    restored_registry,
+)
+from metrics_collector.orchestrator.jobs import JobQueue, JobStatus
+from metrics_collector.orchestrator.progress import ProgressTracker
+from .test_transform import garmin_apple_transform_obj
+
+
+@pytest.fixture
+def memo():
+    PipelineMemo.clear()
+    yield PipelineMemo
+    PipelineMemo.clear()
+
+
+def test_pipeline_memo_reuses_same_key(memo):
+    created = []
+    factory = lambda names: created.append(names) or object()
+    key = ("foo", "2022-01-01", "2022-01-10", ("v1",))
+    first = memo.get(key, None, factory)
+    assert memo.get(key, ["graph_foo"], factory) is first, "Full pipeline covers any graph"
+    assert memo.get(key[:3] + (("v2",),), None, factory) is not first, "New source data require processing"
+    assert created == [None, None]
+
+
+def test_pipeline_memo_promotes_to_full_pipeline(memo):
+    created = []
+    factory = lambda names: created.append(names) or object()
+    key = ("foo", "2022-01-01", "2022-01-10", ("v1",))
+    memo.get(key, ["graph_foo"], factory)
+    full = memo.get(key, ["graph_bar"], factory)
+    assert memo.get(key, ["graph_baz"], factory) is full
+    assert created == [frozenset(["graph_foo"]), None]
+
+
+def test_pipeline_memo_bounded(memo, monkeypatch):
+    monkeypatch.setattr(memo, "max_entries", 2)
+    for i in range(3):
+        memo.get(("foo", i), None, lambda names: object())
+    assert list(memo._entries) == [("foo", 1), ("foo", 2)]
+
+
+def test_caching_by_key(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    calls = []
+
+    @caching(key=lambda graph_name, data_version, session: (graph_name, data_version))
+    def get_graph(graph_name, data_version, session):
+        calls.append(graph_name)
+        return f"{graph_name} {data_version}"
+
+    assert get_graph("foo", "v1", object()) == "foo v1"
+    assert get_graph("foo", "v1", object()) == "foo v1", "Arguments outside key should not matter"
+    assert get_graph("foo", "v2", object()) == "foo v2", "New data version should invalidate"
+    assert calls == ["foo", "foo"]
+
+
+def test_single_flight_coalesces_calls():
+    calls = []
+    started = threading.Event()
+
+    def process(n):
+        calls.append(n)
+        started.set()
+        time.sleep(0.2)
+        return n
+
+    with ThreadPoolExecutor(4) as executor:
+        leader = executor.submit(SingleFlight.do, "foo", process, 1)
+        started.wait()
+        followers = [executor.submit(SingleFlight.do, "foo", process, 2) for _ in range(3)]
+        assert [_.result() for _ in followers] == [1, 1, 1]
+        assert leader.result() == 1
+    assert calls == [1]
+    assert SingleFlight.in_flight() == 0
+
+
+def test_single_flight_shares_exception_with_async_waiters():
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("foo")
+
+    async def wait_for_leader():
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+        return await SingleFlight.ado("bar", fail)
+
+    leader = threading.Thread(target=lambda: pytest.raises(ValueError, SingleFlight.do, "bar", fail))
+    leader.start()
+    with pytest.raises(ValueError, match="foo"):
+        asyncio.run(wait_for_leader())
+    leader.join()
+
+
+def test_single_flight_cancelled_leader_hands_over():
+    calls = []
+
+    async def process(n):
+        calls.append(n)
+        await asyncio.sleep(0.2)
+        return n
+
+    async def cancel_leader():
+        leader = asyncio.create_task(SingleFlight.ado("baz", process, 1))
+        await asyncio.sleep(0.05)
+        follower = asyncio.create_task(SingleFlight.ado("baz", process, 2))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(cancel_leader()) == 2, "Cancellation is not shared with followers"
+    assert calls == [1, 2]
+    assert SingleFlight.in_flight() == 0
+
+
+def test_single_flight_bounded_wait(monkeypatch):
+    monkeypatch.setattr(SingleFlight, "timeout", 0.1)
+    started, release = threading.Event(), threading.Event()
+
+    def hang():
+        started.set()
+        release.wait(5)
+
+    leader = threading.Thread(target=SingleFlight.do, args=("hung", hang))
+    leader.start()
+    started.wait()
+    with pytest.raises(TimeoutError):
+        SingleFlight.do("hung", hang)
+    release.set()
+    leader.join()
+
+
+def test_async_caching_off_event_loop(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    calls = []
+
+    def render(graph_name):
+        calls.append(graph_name)
+        time.sleep(0.2)  # blocking work such as rendering
+        return f"<div>{graph_name}</div>"
+
+    @caching(key=lambda graph_name: ("aget_graph", graph_name))
+    async def aget_graph(graph_name):
+        return await Executors.run("cpu", render, graph_name)
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        results = await asyncio.gather(*(aget_graph("foo") for _ in range(3)))
+        ticker.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(main())
+    assert results == ["<div>foo</div>"] * 3
+    assert calls == ["foo"], "Concurrent calls should be coalesced"
+    assert ticks > 5, "Event loop should not be blocked while rendering"
+    assert asyncio.run(aget_graph("foo")) == "<div>foo</div>"
+    assert calls == ["foo"]
+
+
+class FooExtract:
+    def __init__(self, cached_days):
+        self.cached = {_: {"steps": {"value": 1, "unit": "count"}} for _ in cached_days}
+
+    def get_missing_days(self, dates):
+        return [_ for _ in dates if _ not in self.cached]
+
+    def get_data(self, date_):
+        return self.cached.setdefault(date_, {"steps": {"value": 2, "unit": "count"}})
+
+
+class BarExtract(FooExtract):
+    ...
+
+
+def test_process_dates_progress_events():
+    events = []
+    foo, bar = FooExtract(["2022-01-01", "2022-01-02"]), BarExtract([])
+    ProgressTracker.subscribe_all(events.append)
+    try:
+        Orchestrator._process_dates([foo, bar], "2022-01-01", "2022-01-05")
+    finally:
+        ProgressTracker.unsubscribe_all(events.append)
+    assert [_.overall_progress for _ in events] == [_ / 8 for _ in range(1, 9)]
+    foo_done, bar_done = events[3], events[-1]
+    assert (foo_done.extractor, foo_done.days_cached, foo_done.days_fetched) == ("FooExtract", 2, 2)
+    assert (bar_done.extractor, bar_done.days_cached, bar_done.days_fetched) == ("BarExtract", 0, 4)
+    assert bar_done.bytes_fetched > 0 and bar_done.eta == 0
+    assert ProgressTracker.latest()["BarExtract"] == bar_done
+
+
+class VersionedExtract(FooExtract):
+    def __init__(self, cached_days, username="foo", password="bar"):
+        super().__init__(cached_days)
+        self.parameters = {"foo_username": username, "foo_password": password}
+
+    def get_data_version(self):
+        return f"{len(self.cached)}"
+
+
+def test_process_dates_cached_by_params_and_version_processed(tmp_path, monkeypatch, mocker):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    process = mocker.spy(Orchestrator, "_process_dates")
+    foo = VersionedExtract(["2022-01-01"])
+    for _ in range(2):
+        Orchestrator.process_dates([foo], "2022-01-01", "2022-01-03")
+    assert process.call_count == 1, "Cached by the data version once processed"
+    Orchestrator.process_dates([VersionedExtract(foo.cached, password="other")], "2022-01-01", "2022-01-03")
+    assert process.call_count == 1, "Secrets should not be part of the key"
+    Orchestrator.process_dates([VersionedExtract(foo.cached, username="other")], "2022-01-01", "2022-01-03")
+    assert process.call_count == 2, "Other parameters such as another account should be processed"
+
+
+def test_dag_plan_precomputed():
+    class FooParamsExtract:
+        @classmethod
+        def get_parameters(cls):
+            return {"foo_username": str}
+
+    class FooLoad:
+        def get_all_graph_methods(self):
+            return (self.graph_foo, self.graph_bar)
+
+        def graph_foo(self):
+            ...
+
+        def graph_bar(self):
+            ...
+
+    plan = DagPlan("foo")
+    plan = plan.with_class(FooParamsExtract, ClassType.extract).with_class(object, ClassType.transform)
+    plan = plan.with_class(FooLoad, ClassType.load).with_class(dict, ClassType.transform)
+    assert (plan.transform_class, plan.load_class) == (object, FooLoad), "First transform class should be used"
+    assert plan.graph_names == ("graph_foo", "graph_bar")
+    assert dict(plan.extract_parameters[FooParamsExtract]) == {"foo_username": str}
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        plan.graph_names = ()
+    with pytest.raises(TypeError):
+        plan.extract_parameters[FooParamsExtract]["foo_password"] = str
+    assert Orchestrator().get_dag_plan("not_registered").extract_classes == ()
+
+
+def test_restored_registry_forgets_classes_declared():
+    from metrics_collector.transform import BaseTransform
+
+    with restored_registry():
+
+        class RestoredTransform(BaseTransform):
+            input_schema, dag_name = None, "restored"
+
+            def process_pipeline(self, from_, to_):
+                ...
+
+        assert Orchestrator().get_dag_plan("restored").transform_class is RestoredTransform
+    assert "restored" not in Orchestrator().get_dag_names()
+    assert "garmin_and_apple" in Orchestrator().get_dag_names()
+
+
+def test_job_queue_dedupe_and_events():
+    calls = []
+
+    async def render(progress_bar):
+        calls.append(1)
+        await asyncio.get_running_loop().run_in_executor(None, progress_bar.update, 0.5)
+        await asyncio.sleep(0.05)
+        return "<div>foo</div>"
+
+    async def main():
+        queue = JobQueue(workers=2)
+        job = await queue.submit(("graph", "foo"), render)
+        same = await queue.submit(("graph", "foo"), render)
+        events = [_ async for _ in queue.events(job.id)]
+        return queue, job, same, events
+
+    queue, job, same, events = asyncio.run(main())
+    assert same is job and calls == [1], "Identical pending job should share id"
+    assert [_["status"] for _ in events][-1] == "done"
+    assert 0.5 in [_["progress"] for _ in events]
+    assert queue.get(job.id).result == "<div>foo</div>"
+
+
+def test_job_queue_failure_and_retention():
+    async def fail(progress_bar):
+        raise ValueError("foo")
+
+    async def main():
+        queue = JobQueue(workers=1, retention_secs=60)
+        job = await queue.submit("foo", fail)
+        await queue._queue.join()
+        return queue, job
+
+    queue, job = asyncio.run(main())
+    assert (job.status, job.error) == (JobStatus.failed, "foo")
+    job.finished -= 61
+    assert queue.get(job.id) is None, "Expired jobs should be removed"
+
+
+@pytest.fixture
+def process_executor():
+    executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("fork"))
+    Executors.set("cpu", executor)
+    yield executor
+    with Executors._lock:
+        Executors._executors.pop("cpu", None)
+    executor.shutdown()
+
+
+def test_aget_graph_within_process(tmp_path, monkeypatch, process_executor, garmin_apple_transform_obj, mocker):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    run = mocker.spy(Executors, "run")
+    o = Orchestrator()
+    from_, to_ = "2022-01-01", "2022-06-30"
+
+    async def main():
+        return await asyncio.gather(
+            *(o.aget_graph(_, from_, to_, "garmin_and_apple", garmin_apple_transform_obj, "html")
+              for _ in ("graph_weekly_weight", "graph_weekly_distance"))
+        )
+
+    weight, distance = asyncio.run(main())
+    assert 'class="plotly-graph-div"' in weight and 'class="plotly-graph-div"' in distance
+    sent = [_.args for _ in run.call_args_list if _.args[0] == "cpu"]
+    assert len(sent) == 2
+    assert not any(_ is garmin_apple_transform_obj for args in sent for _ in args), "Only keys sent to processes"
+    assert process_executor.submit(os.getpid).result() != os.getpid()
@@ -0,0 +1,208 @@
+import asyncio
+import datetime
+import json
+import os
+import pickle
+import threading
+
+import pytest
+
+from metrics_collector.orchestrator.generic import DagPlan, Orchestrator
+from metrics_collector.scheduler import api, tasks
+from metrics_collector.scheduler.api import MyScheduler, scheduler_config_file
+from metrics_collector.scheduler.triggers import OffsetCronTrigger
+from metrics_collector.storage.cache import Cache
+from metrics_collector.storage.usage import UsageTracker
+
+
+def schedule(hour: int) -> dict:
+    return {
+        "dag_name": "foo",
+        "from_": "7 days ago",
+        "to_": "today",
+        "extract_params": {},
+        "schedule_params": {"year": "*", "month": "*", "day": "*", "day_of_week": "*", "hour": hour, "minute": 0},
+        "action_type": "Cache",
+        "action_data": {},
+    }
+
+
+def write_config(*schedules: dict):
+    f = scheduler_config_file()
+    f.write_text(json.dumps(schedules))
+    stat = f.stat()
+    os.utime(f, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))  # coarse mtime within same test
+
+
+@pytest.fixture
+def scheduler(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    monkeypatch.setattr(MyScheduler, "_instance", None)
+    write_config(schedule(1), schedule(2))
+    return MyScheduler()
+
+
+def test_reload_applies_diff(scheduler):
+    jobs = {_.id: _ for _ in scheduler.scheduler.get_jobs()}
+    assert len(jobs) == 2
+    write_config(schedule(1), schedule(3))
+    asyncio.run(scheduler.reload_on_config_update())
+    reloaded = {_.id: _ for _ in scheduler.scheduler.get_jobs()}
+    assert len(reloaded) == 2
+    kept = jobs.keys() & reloaded.keys()
+    assert len(kept) == 1, "Only the modified schedule should be replaced"
+    assert all(jobs[_] is reloaded[_] for _ in kept)
+
+
+def test_reload_keeps_job_of_group_edited(scheduler):
+    (job_id,) = [_.id for _ in scheduler.scheduler.get_jobs() if _.args[0].schedule_params.hour == 1]
+    write_config(schedule(1), schedule(1) | {"extract_params": {"foo_user": "bar"}}, schedule(2))
+    asyncio.run(scheduler.reload_on_config_update())
+    job = scheduler.scheduler.get_job(job_id)
+    assert job is not None, "Schedules added to a group should keep its job"
+    assert len(job.args) == 2
+    assert len(scheduler.scheduler.get_jobs()) == 2
+
+
+def test_reload_only_when_modified(scheduler, mocker):
+    load = mocker.spy(api, "load_scheduler_config")
+    asyncio.run(scheduler.reload_on_config_update())
+    assert load.call_count == 0
+    write_config(schedule(1))
+    asyncio.run(scheduler.reload_on_config_update())
+    assert load.call_count == 1
+    assert len(scheduler.scheduler.get_jobs()) == 1
+
+
+def test_schedules_use_action_executor(scheduler, mocker):
+    add_job = mocker.spy(scheduler.scheduler, "add_job")
+    write_config(schedule(3))
+    asyncio.run(scheduler.reload_on_config_update())
+    kwargs = add_job.call_args.kwargs
+    assert (kwargs["executor"], kwargs["max_instances"]) == ("render", 1)
+
+
+def blocking_job(event):
+    event.wait(2)
+
+
+def test_queue_depth_metric(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    monkeypatch.setattr(MyScheduler, "_instance", None)
+    scheduler = MyScheduler(executors={"default": {"type": "asyncio"}, "io": {"type": "threadpool", "max_workers": 1}})
+    release = threading.Event()
+
+    async def main():
+        scheduler.start()
+        for _ in range(2):
+            scheduler.add_task(blocking_job, "date", (release,), executor="io")
+        await asyncio.sleep(0.2)
+        during = scheduler.get_metrics()
+        release.set()
+        await asyncio.sleep(0.2)
+        scheduler.scheduler.shutdown()
+        return during, scheduler.get_metrics()
+
+    during, after = asyncio.run(main())
+    assert during["queue_depth"]["io"] == 2, "Second job should be waiting for the single worker"
+    assert (after["queue_depth"]["io"], after["executed"]) == (0, 2)
+
+
+def test_warm_popular_groups_by_period(tmp_path, monkeypatch, mocker):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    for graph_name, count in (("graph_a", 3), ("graph_b", 2), ("graph_c", 1)):
+        for _ in range(count):
+            UsageTracker.record("foo", "30 days ago", "today", graph_name, "html")
+    mocker.patch.object(Orchestrator, "get_stored_params", return_value={})
+    mocker.patch.object(Orchestrator, "get_extract_objects", return_value=[])
+    process_dates = mocker.patch.object(Orchestrator, "aprocess_dates", mocker.AsyncMock())
+    mocker.patch.object(Orchestrator, "aget_transform_object", mocker.AsyncMock())
+    get_graph = mocker.patch.object(Orchestrator, "aget_graph", mocker.AsyncMock())
+    asyncio.run(tasks.warm_popular(top_n=2))
+    assert process_dates.call_count == 1, "Graphs of the same period should share extraction"
+    assert sorted(_.args[0] for _ in get_graph.call_args_list) == ["graph_a", "graph_b"]
+
+
+def test_schedules_due_together_share_graphs(scheduler, mocker):
+    write_config(schedule(1), schedule(1) | {"from_": "14 days ago"}, schedule(1), schedule(2))
+    asyncio.run(scheduler.reload_on_config_update())
+    jobs = sorted((len(_.args) for _ in scheduler.scheduler.get_jobs()), reverse=True)
+    assert jobs == [2, 1, 1], "Same dag, period and format due at the same time should be one job"
+
+    mocker.patch.object(Orchestrator, "get_stored_params", return_value={})
+    mocker.patch.object(Orchestrator, "get_extract_objects", return_value=[])
+    process_dates = mocker.patch.object(Orchestrator, "process_dates")
+    mocker.patch.object(Orchestrator, "get_transform_object")
+    mocker.patch.object(Orchestrator, "get_all_graphs", return_value=iter([b"png"]))
+    run = mocker.spy(api.CacheAction, "run")
+    group = max(scheduler.scheduler.get_jobs(), key=lambda _: len(_.args)).args
+    api.run_actions(*group)
+    assert run.call_count == 2
+    assert process_dates.call_count == 1
+    assert api.BaseAction.get_graphs(group[0], "png") == [b"png"]
+
+
+def test_offset_cron_trigger():
+    trigger = OffsetCronTrigger(offset=90, hour=7, minute=0, timezone="UTC")
+    now = datetime.datetime(2022, 1, 1, 7, 0, 30, tzinfo=datetime.timezone.utc)
+    first = trigger.get_next_fire_time(None, now)
+    assert first == datetime.datetime(2022, 1, 1, 7, 1, 30, tzinfo=datetime.timezone.utc)
+    assert trigger.get_next_fire_time(first, first) == first + datetime.timedelta(days=1)
+    assert pickle.loads(pickle.dumps(trigger)).offset == 90
+
+
+def test_spread_jobs_sharing_service(scheduler, mocker):
+    plan = DagPlan("foo", extract_classes=(type("FooExtract", (), {}),))
+    mocker.patch.object(Orchestrator, "get_dag_plan", return_value=plan)
+    write_config(
+        schedule(1) | {"from_": "1 days ago"},
+        schedule(1) | {"from_": "2 days ago"},
+        schedule(1) | {"from_": "3 days ago"},
+        schedule(2),
+    )
+    asyncio.run(scheduler.reload_on_config_update())
+    offsets = sorted(_.trigger.offset for _ in scheduler.scheduler.get_jobs())
+    assert offsets == [0, 0, 100, 200], "Jobs due at the same time should be spread across 300s"
+    write_config(schedule(1) | {"from_": "1 days ago"}, schedule(1) | {"schedule_params": {**schedule(1)["schedule_params"], "jitter": 30}})
+    asyncio.run(scheduler.reload_on_config_update())
+    triggers = [_.trigger for _ in scheduler.scheduler.get_jobs()]
+    assert sorted(_.offset for _ in triggers) == [0, 150], "Offsets should be respread as schedules change"
+    assert {_.jitter for _ in triggers} == {None, 30}
+
+
+def test_schedules_differing_by_jitter_share_job(scheduler):
+    jittered = lambda jitter: schedule(1) | {"schedule_params": {**schedule(1)["schedule_params"], "jitter": jitter}}
+    write_config(schedule(1), jittered(30), jittered(60))
+    asyncio.run(scheduler.reload_on_config_update())
+    (job,) = scheduler.scheduler.get_jobs()
+    assert (len(job.args), job.trigger.jitter) == (3, 60), "One job delayed by the largest jitter"
+    write_config(schedule(1), jittered(30))
+    asyncio.run(scheduler.reload_on_config_update())
+    assert [_.trigger.jitter for _ in scheduler.scheduler.get_jobs()] == [30]
+
+
+def test_snapshot_action_versions(tmp_path, monkeypatch, mocker):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    monkeypatch.setenv("SNAPSHOT_DIR", (tmp_path / "snapshots").as_posix())
+    mocker.patch.object(Orchestrator, "get_graph_names", return_value=["graph_a"])
+    mocker.patch.object(Orchestrator, "get_stored_params", return_value={})
+    mocker.patch.object(Orchestrator, "get_extract_objects", return_value=[])
+    mocker.patch.object(Orchestrator, "process_dates")
+    mocker.patch.object(Orchestrator, "get_transform_object")
+    graphs = {"json": '{"data": []}'}
+    mocker.patch.object(Orchestrator, "get_all_graphs", side_effect=lambda *args: iter([graphs[args[-1]]]))
+    config = api.ScheduleConfig(**schedule(1) | {"action_type": "Snapshot", "action_data": {"name": "weekly", "keep": 1}})
+    target = tmp_path / "snapshots" / "foo" / "weekly"
+
+    api.run_actions(config)
+    first = json.loads((target / "latest.json").read_text())["version"]
+    assert (target / first / "graph_a.json").read_text() == graphs["json"]
+    assert "graph_a" in (target / first / "index.html").read_text()
+    assert '<script src="/static/plotly.min.js">' in (target / first / "graph_a.html").read_text()
+    graphs["json"] = '{"data": [1]}'
+    Cache.get_instance("schedule_graphs").clear()
+    api.run_actions(config)
+    latest = json.loads((target / "latest.json").read_text())["version"]
+    assert latest != first
+    assert [_.name for _ in target.iterdir() if _.is_dir()] == [latest], "Only the latest version should be kept"
+    assert f"url={latest}/" in (target / "index.html").read_text()
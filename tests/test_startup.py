@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+from metrics_collector.orchestrator.generic import Orchestrator
+
+import_budget_ms = int(os.getenv("IMPORT_TIME_BUDGET_MS", 1000))
+heavy_modules = ("pandas", "pandera", "plotly", "kaleido", "garminconnect", "apple_health", "apprise", "pywebio")
+
+
+def get_import_times(module: str) -> dict[str, int]:
+    """Cumulative microseconds importing each module along with module, as reported by python -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_import_time_within_budget():
+    times = get_import_times("metrics_collector.__main__")
+    assert not [_ for _ in heavy_modules if _ in times], "Heavy dependencies should be imported on first use"
+    assert times["metrics_collector.__main__"] / 1000 < import_budget_ms
+
+
+def test_plugins_loaded_on_first_use():
+    assert "pandas" not in get_import_times("metrics_collector.orchestrator.generic")
+    assert "garmin_and_apple" in Orchestrator().get_dag_names()
+
+
+def test_registry_complete_on_plain_import():
+    code = "from metrics_collector.orchestrator.generic import Orchestrator; print(sorted(Orchestrator.dag_plans))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert "garmin_and_apple" in result.stdout, "Plugins should be loaded as the registry is first accessed"
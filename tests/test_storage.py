@@ -0,0 +1,123 @@
+import datetime
+import gzip
+import threading
+import time
+
+from metrics_collector.storage.cache import Cache
+from metrics_collector.storage.usage import UsageKey, UsageTracker
+
+
+def test_cache_lru_eviction(tmp_path):
+    cache = Cache((tmp_path / "cache.sqlite").as_posix(), max_entries=2, l1_entries=1)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    time.sleep(0.01)
+    assert cache.get("a") == 1  # from disk as L1 only holds "b", marking "a" recently used
+    cache.set("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None, "Least recently used should be evicted"
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_ttl_and_persisted(tmp_path):
+    path = (tmp_path / "cache.sqlite").as_posix()
+    cache = Cache(path)
+    cache.set("expiring", "foo", ttl=0.05)
+    cache.set("kept", {"foo": [1, 2]})
+    time.sleep(0.1)
+    assert cache.get("expiring", "missing") == "missing"
+    other_process = Cache(path)
+    assert other_process.get("kept") == {"foo": [1, 2]}
+    stats = other_process.stats()
+    assert (stats["hits"], stats["l1_hits"], stats["misses"], stats["entries"]) == (1, 0, 0, 1)
+
+
+def test_cache_concurrent_writers(tmp_path):
+    cache = Cache((tmp_path / "cache.sqlite").as_posix(), max_entries=50)
+
+    def write(n):
+        for i in range(20):
+            cache.set(f"{n}-{i}", "x" * 1000)
+            cache.get(f"{n}-{i // 2}")
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    [_.start() for _ in threads]
+    [_.join() for _ in threads]
+    assert len(cache) == 50
+    assert cache.stats()["writes"] == 80
+
+
+def test_usage_popular_relative_periods(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    today = datetime.date(2022, 3, 31)
+    for _ in range(2):
+        UsageTracker.record("foo", "2022-03-01", "2022-03-31", "graph_a", "html", today=today)
+    UsageTracker.record("foo", datetime.date(2022, 3, 24), today, "graph_b", "json", today=today)
+    (top, score), (second, _) = UsageTracker.get_popular(2)
+    assert top == UsageKey("foo", 30, 0, "graph_a", "html")
+    assert f"{top}" == "foo graph_a.html last 30 days"
+    assert second.get_period(datetime.date(2022, 4, 30)) == (datetime.date(2022, 4, 23), datetime.date(2022, 4, 30))
+    assert 1.9 < score <= 2
+    assert len(UsageTracker.get_popular(1)) == 1
+
+
+def test_usage_keeps_past_periods_absolute(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    for today in (datetime.date(2022, 3, 31), datetime.date(2022, 5, 2)):
+        UsageTracker.record("foo", "2022-01-01", "2022-01-31", "graph_a", "html", today=today)
+    UsageTracker.record("foo", "2022-04-01", "2022-04-30", "graph_a", "html", today=datetime.date(2022, 5, 1))
+    (past, score), (recent, _) = UsageTracker.get_popular(2)
+    assert 1.9 < score <= 2, "Same past period requested on different days"
+    assert past.get_period(datetime.date(2022, 6, 1)) == (datetime.date(2022, 1, 1), datetime.date(2022, 1, 31))
+    assert f"{past}" == "foo graph_a.html from 2022-01-01 to 2022-01-31"
+    assert recent == UsageKey("foo", 30, 1, "graph_a", "html")
+
+
+def test_cache_precompressed_values(tmp_path):
+    path = (tmp_path / "cache.sqlite").as_posix()
+    cache = Cache(path)
+    compressed = gzip.compress(b"<div>graph</div>" * 100)
+    stored = cache.set("encoded", compressed, compress=False)
+    cache.set("other", "x" * 1000)
+    assert stored > len(compressed), "Stored as is rather than compressed again"
+    other_process = Cache(path)
+    assert other_process.get("encoded") == compressed
+    assert other_process.get("other") == "x" * 1000
+
+
+def test_usage_pruned(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    monkeypatch.setattr(UsageTracker, "max_keys", 3)
+    today = datetime.date(2022, 3, 31)
+    for n in range(5):
+        for _ in range(n + 1):
+            UsageTracker.record("foo", "2022-03-01", "2022-03-31", f"graph_{n}", "html", today=today)
+    stale = UsageKey("foo", 30, 0, "graph_4", "html")
+    cache = Cache.get_instance(UsageTracker.cache_name)
+    _, score, last = cache.get(UsageTracker._cache_key(stale))
+    cache.set(UsageTracker._cache_key(stale), (stale, score, last - 90 * 86400))  # used months ago
+    assert UsageTracker.prune() == 2
+    assert [_.graph_name for _, score in UsageTracker.get_popular(10)] == ["graph_3", "graph_2", "graph_1"]
+    assert len(cache.items("usage:")) == 3
+
+
+def test_cache_access_times_batched(tmp_path, mocker):
+    cache = Cache((tmp_path / "cache.sqlite").as_posix(), l1_entries=0)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    flush = mocker.spy(cache, "_flush_accessed")
+    for _ in range(3):
+        assert cache.get("a") == 1
+    assert flush.call_count == 0, "Disk hits should not each be written"
+    cache.set("c", 3)
+    assert flush.call_count == 1
+    assert cache._accessed == {}
+
+
+def test_cache_removes_legacy_shelve(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    for name in ("legacy_cache.db", "legacy_cache.dat", "legacy_cache.dir", "other.db"):
+        (tmp_path / name).write_bytes(b"shelve")
+    Cache.get_instance("legacy_cache").set("a", 1)
+    assert sorted(_.name for _ in tmp_path.iterdir() if "sqlite" not in _.name) == ["other.db"]
@@ -1,33 +1,78 @@
 from datetime import datetime, date
 
+import numpy as np
 import pandas as pd
 import pytest
 
+from metrics_collector.orchestrator.generic import restored_registry
 from metrics_collector.transform import BaseTransform
+from metrics_collector.transform.base import derives
+from metrics_collector.transform.transformers import GarminAppleTransform
 import pandera as pa
-from .test_extract import extract_obj
+from .test_extract import extract_obj, sample_extract_class
 
 
-class FooTransform(BaseTransform):
-    input_schema = pa.DataFrameSchema(
-        {
-            "running": pa.Column(float, nullable=True),
-            "walking": pa.Column(float, nullable=True),
-        },
-    )
-    dag_name = "foo"
+@pytest.fixture
+def foo_transform_class():
+    with restored_registry():
 
-    def process_pipeline(
-        self, from_: datetime.date, to_: datetime.date
-    ) -> pd.DataFrame:
-        (self.index_as_dt().aggregate_combined_dataframes().filter_period(from_, to_))
-        return self.df
+        class FooTransform(BaseTransform):
+            input_schema = pa.DataFrameSchema(
+                {
+                    "running": pa.Column(float, nullable=True),
+                    "walking": pa.Column(float, nullable=True),
+                },
+            )
+            dag_name = "foo"
+
+            def process_pipeline(
+                self, from_: datetime.date, to_: datetime.date
+            ) -> pd.DataFrame:
+                (self.index_as_dt().aggregate_combined_dataframes().filter_period(from_, to_))
+                return self.df
+
+        yield FooTransform
 
 
 @pytest.mark.skip(reason="until research why fail in ubuntu")
 @pytest.fixture
-def transform_obj(extract_obj):
-    return FooTransform(extract_obj)
+def transform_obj(extract_obj, foo_transform_class):
+    return foo_transform_class(extract_obj)
+
+
+class DataFrameExtract:
+    """Extracted data of a dataframe, standing in for an extract object without registering one"""
+
+    def __init__(self, df: pd.DataFrame, data_version: str = "1"):
+        self.df = df
+        self.data_version = data_version
+
+    def to_df(self) -> pd.DataFrame:
+        return self.df
+
+    def get_data_version(self) -> str:
+        return self.data_version
+
+
+@pytest.fixture
+def garmin_apple_transform_obj():
+    """Ten years of daily data of all garmin and apple columns"""
+    index = pd.date_range("2013-01-01", "2022-12-31", freq="D")
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "distancewalkingrunning_km_sum": rng.uniform(2, 15, len(index)),
+            "bodymass_kg": rng.normal(80, 1, len(index)),
+            "bloodpressuresystolic_mmHg": rng.normal(125, 5, len(index)),
+            "bloodpressurediastolic_mmHg": rng.normal(80, 5, len(index)),
+            "distancewalkingrunning_km": rng.uniform(2, 15, len(index)),
+            "running_distance_meters": rng.choice([np.nan, 6000.0], len(index)),
+            "running_duration_seconds": rng.uniform(1500, 2100, len(index)),
+            "walking_distance_meters": rng.uniform(1000, 5000, len(index)),
+        },
+        index=index,
+    )
+    return GarminAppleTransform(DataFrameExtract(df))
 
 
 @pytest.mark.skip(reason="until research why fail in ubuntu")
@@ -44,3 +89,57 @@ def test_process_pipeline(transform_obj):
     assert df.shape == (1, 2), "Unable to filter out specific date"
     assert df.index.name == "date", "Index columns should be date"
     assert set(df.columns) == {"running_meter", "walking_meter"}
+
+
+def test_merge_frames_joins_and_resolves_overlap():
+    garmin = pd.DataFrame(
+        {"date": [date(2022, 1, 2), date(2022, 1, 1)], "running": [2.0, 1.0], "steps": [None, 10.0]},
+        index=[date(2022, 1, 2), date(2022, 1, 1)],
+    )
+    apple = pd.DataFrame(
+        {"date": [date(2022, 1, 2), date(2022, 1, 3)], "weight": [80.0, 81.0], "steps": [20.0, 30.0]},
+        index=[date(2022, 1, 2), date(2022, 1, 3)],
+    )
+    df = BaseTransform.merge_frames([garmin, pd.DataFrame(), apple])
+    assert list(df.index) == list(pd.to_datetime(["2022-01-01", "2022-01-02", "2022-01-03"]))
+    assert list(df.columns) == ["running", "steps", "weight"]
+    assert df.steps.tolist() == [10.0, 20.0, 30.0], "Expected first non-null value across extractors"
+    assert df.weight.isna().tolist() == [True, False, False]
+
+
+@pytest.fixture
+def pruned_transform_class():
+    with restored_registry():
+
+        class PrunedTransform(BaseTransform):
+            input_schema = pa.DataFrameSchema({"running": pa.Column(float, nullable=True)})
+            dag_name = "pruned"
+
+            def process_pipeline(
+                self, from_: datetime.date, to_: datetime.date
+            ) -> pd.DataFrame:
+                self.index_as_dt().aggregate_combined_dataframes().add_running_km().add_pace()
+                return self.df
+
+            @derives("running_km", requires=("running",))
+            def add_running_km(self):
+                self.df["running_km"] = self.df.running / 1000
+                return self
+
+            @derives("pace", requires=("running_km",))
+            def add_pace(self):
+                self.df["pace"] = 1 / self.df.running_km
+                return self
+
+        yield PrunedTransform
+
+
+def test_run_pipeline_only_derives_required_columns(pruned_transform_class):
+    extract = pd.DataFrame({"running": [1000.0, 2000.0]}, index=[date(2022, 1, 1), date(2022, 1, 2)])
+    transform = pruned_transform_class()
+    transform.source_df = BaseTransform.merge_frames([extract])
+    df = transform.run_pipeline(date(2022, 1, 1), date(2022, 1, 2), columns=["running_km"])
+    assert set(df.columns) == {"running", "running_km"}
+    df = transform.run_pipeline(date(2022, 1, 1), date(2022, 1, 2), columns=["pace"])
+    assert set(df.columns) == {"running", "running_km", "pace"}, "Expected dependencies being derived"
+    assert transform.run_pipeline(date(2022, 1, 1), date(2022, 1, 2)).pace.tolist() == [1.0, 0.5]
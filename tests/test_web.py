@@ -0,0 +1,162 @@
+import asyncio
+import datetime
+import gzip
+import io
+import json
+import zipfile
+
+from fastapi import FastAPI
+from starlette.requests import Request
+from starlette.routing import Mount
+
+from metrics_collector.orchestrator.generic import PipelineMemo
+from metrics_collector.web import rest, service
+from metrics_collector.web.rest import (
+    batch_json,
+    batch_zip,
+    cache_headers,
+    compressed_response,
+    etag_matches,
+    graph_etag,
+    is_historical,
+    negotiate_encoding,
+)
+from metrics_collector.web.service import PrecompressedStaticFiles, get_plotlyjs_route
+from .test_transform import garmin_apple_transform_obj
+
+
+def make_request(accept_encoding: str) -> Request:
+    return Request({"type": "http", "headers": [(b"accept-encoding", accept_encoding.encode())]})
+
+
+def test_compressed_response_when_accepted():
+    content = '{"data": []}' * 200
+    response = compressed_response(content, "application/json", make_request("gzip, deflate"))
+    assert response.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(response.body).decode() == content
+
+
+def test_uncompressed_response_when_not_accepted():
+    response = compressed_response("{}" * 1000, "application/json", make_request("identity"))
+    assert "content-encoding" not in response.headers
+
+
+def test_etag_by_data_version_and_if_none_match():
+    etag = graph_etag("foo", "graph_a", "png", "2022-01-01", "2022-02-01", ("1-10",))
+    assert etag == graph_etag("foo", "graph_a", "png", datetime.date(2022, 1, 1), datetime.date(2022, 2, 1), ("1-10",))
+    assert etag != graph_etag("foo", "graph_a", "png", "2022-01-01", "2022-02-01", ("2-10",))
+    request = Request({"type": "http", "headers": [(b"if-none-match", f'"other", {etag.removeprefix("W/")}'.encode())]})
+    assert etag_matches(request, etag)
+    assert not etag_matches(make_request("gzip"), etag)
+
+
+def test_cache_headers_of_historical_period():
+    assert not is_historical(datetime.date.today())
+    assert is_historical(datetime.date.today() - datetime.timedelta(days=30))
+    assert cache_headers('W/"a"', True)["Cache-Control"] == "public, max-age=86400", "Bounded as a day may be partial"
+    headers = cache_headers('W/"a"', False, ("1640995200000000000-10", None))
+    assert (headers["Cache-Control"], headers["Last-Modified"]) == ("no-cache", "Sat, 01 Jan 2022 00:00:00 GMT")
+
+
+def test_negotiate_encoding(mocker):
+    assert negotiate_encoding("gzip, deflate, br") == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("*;q=0.5") == "gzip"
+    mocker.patch("metrics_collector.web.rest.get_encodings", return_value=("br", "gzip"))
+    assert negotiate_encoding("gzip, br") == "br"
+    assert negotiate_encoding("gzip, br;q=0.5") == "gzip"
+
+
+def test_static_files_precompressed(tmp_path):
+    (tmp_path / "graph.html").write_text("<div>graph</div>")
+    (tmp_path / "graph.html.gz").write_bytes(gzip.compress(b"<div>graph</div>"))
+    static = PrecompressedStaticFiles(directory=tmp_path)
+
+    def get(accept_encoding: str):
+        scope = {"type": "http", "method": "GET", "path": "/graph.html", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+        return asyncio.run(static.get_response("graph.html", scope))
+
+    response = get("gzip")
+    assert (response.headers["content-encoding"], response.media_type) == ("gzip", "text/html")
+    assert response.path.endswith("graph.html.gz")
+    for accept_encoding in ("identity", "gzip;q=0, identity", "xgzip"):
+        response = get(accept_encoding)
+        assert "content-encoding" not in response.headers
+        assert response.headers["vary"] == "Accept-Encoding"
+    assert get("*").headers["content-encoding"] == "gzip"
+
+
+def test_snapshots_mounted_from_data_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    monkeypatch.setattr(service, "app", FastAPI())
+    service.WebServer.mount_static()
+    mounts = {_.path: _ for _ in service.app.routes if isinstance(_, Mount)}
+    assert list(mounts).index("/static/snapshots") < list(mounts).index("/static"), "Snapshots before other static files"
+    assert mounts["/static/snapshots"].app.directory == tmp_path / "snapshots"
+    assert (tmp_path / "snapshots").is_dir()
+
+
+def test_batch_json_and_zip():
+    figures = {"graph_a": '{"data": [1]}', "graph_b": '{"data": []}'}
+    assert json.loads(batch_json(figures, "json")) == {"graph_a": {"data": [1]}, "graph_b": {"data": []}}
+    assert json.loads(batch_json({"graph_a": b"\x89PNG"}, "png")) == {"graph_a": "iVBORw=="}
+    with zipfile.ZipFile(io.BytesIO(batch_zip(figures, "json"))) as f:
+        assert f.namelist() == ["graph_a.json", "graph_b.json"]
+        assert f.read("graph_a.json") == b'{"data": [1]}'
+
+
+def test_not_modified_before_processing_when_extracted(tmp_path, monkeypatch, mocker):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    extract_object = mocker.Mock(**{"get_missing_days.return_value": [], "get_data_version.return_value": "1-10"})
+    o = rest.o
+    mocker.patch.object(o, "get_extract_params_def", return_value=[])
+    mocker.patch.object(o, "get_stored_params", return_value={})
+    mocker.patch.object(o, "get_extract_objects", return_value=[extract_object])
+    process_dates = mocker.patch.object(o, "aprocess_dates", mocker.AsyncMock())
+    transform = mocker.patch.object(o, "aget_transform_object", mocker.AsyncMock(return_value=mocker.Mock(data_version=("1-10",))))
+    mocker.patch.object(o, "aget_graph", mocker.AsyncMock(return_value=b"png"))
+    mocker.patch.object(rest.UsageTracker, "record")
+
+    def get(*headers):
+        request = Request({"type": "http", "path": "/graph/foo", "headers": list(headers)})
+        args = dict(request=request, format="png", from_date="7 days ago", to_date="today", graph="graph_a")
+        return asyncio.run(rest.graph(**args))
+
+    first = get()
+    assert (first.status_code, first.headers["cache-control"]) == (200, "no-cache")
+    assert get((b"if-none-match", first.headers["etag"].encode())).status_code == 304
+    assert (process_dates.call_count, transform.call_count) == (1, 1), "Not modified known before processing"
+    extract_object.get_data_version.return_value = "2-10"
+    assert get((b"if-none-match", first.headers["etag"].encode())).status_code == 200
+
+
+def test_bundled_plotlyjs_served():
+    import plotly
+
+    def get(*headers):
+        return get_plotlyjs_route(Request({"type": "http", "headers": list(headers)}))
+
+    response = get((b"accept-encoding", b"gzip"))
+    assert response.headers["etag"] == f'"plotly-{plotly.__version__}"'
+    assert response.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(response.body).startswith(b"/**") and response.headers["vary"] == "Accept-Encoding"
+    assert get((b"if-none-match", response.headers["etag"].encode())).status_code == 304
+
+
+def test_batch_processes_pipeline_once(tmp_path, monkeypatch, mocker, garmin_apple_transform_obj):
+    monkeypatch.setenv("DATA_DIR", tmp_path.as_posix())
+    PipelineMemo.clear()
+    o = rest.o
+    mocker.patch.object(o, "get_extract_params_def", return_value=[])
+    mocker.patch.object(o, "get_stored_params", return_value={})
+    mocker.patch.object(o, "get_extract_objects", return_value=[])
+    mocker.patch.object(o, "aprocess_dates", mocker.AsyncMock())
+    mocker.patch.object(o, "aget_transform_object", mocker.AsyncMock(return_value=garmin_apple_transform_obj))
+    mocker.patch.object(rest.UsageTracker, "record")
+    run_pipeline = mocker.spy(garmin_apple_transform_obj, "run_pipeline")
+    request = Request({"type": "http", "path": "/graph/garmin_and_apple/batch", "headers": []})
+    args = dict(request=request, format="json", container="json", from_date="2022-01-01", to_date="2022-06-30", graph=None)
+    response = asyncio.run(rest.graphs(**args))
+    assert set(json.loads(response.body)) == set(o.get_graph_names("garmin_and_apple"))
+    assert run_pipeline.call_count == 1, "All graphs should be rendered from one processed pipeline"
+    PipelineMemo.clear()